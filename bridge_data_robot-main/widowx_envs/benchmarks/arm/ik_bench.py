@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+'''
+IK solutions per second for the board poses of the chess bot: one pose at
+a time with modern_robotics.IKinSpace (what the arm interface does per
+move) against widowx_controller.batch_ik on the whole stack, each trying
+the arm's three initial guesses.
+
+Needs the widowx_controller package on the path (it lives in the ROS
+workspace), e.g.
+
+    PYTHONPATH=.:widowx_controller/src python benchmarks/arm/ik_bench.py --poses 500
+'''
+
+import argparse
+import json
+import time
+
+import numpy as np
+import modern_robotics as mr
+
+from widowx_controller.batch_ik import batch_ikin_seeds
+from widowx_envs.board_poses import calibration_poses
+
+# wx250s screw axes and home pose, as in interbotix_xs_modules.mr_descriptions
+SLIST = np.array([[0.0, 0.0, 1.0, 0.0, 0.0, 0.0],
+                  [0.0, 1.0, 0.0, -0.11065, 0.0, 0.0],
+                  [0.0, 1.0, 0.0, -0.36065, 0.0, 0.04975],
+                  [1.0, 0.0, 0.0, 0.0, 0.36065, 0.0],
+                  [0.0, 1.0, 0.0, -0.36065, 0.0, 0.29975],
+                  [1.0, 0.0, 0.0, 0.0, 0.36065, 0.0]]).T
+M = np.array([[1.0, 0.0, 0.0, 0.458325],
+              [0.0, 1.0, 0.0, 0.0],
+              [0.0, 0.0, 1.0, 0.36065],
+              [0.0, 0.0, 0.0, 1.0]])
+LOWER_LIMITS = np.array([-3.14158, -1.88496, -2.14675, -3.14158, -1.74533, -3.14158])
+UPPER_LIMITS = np.array([3.14158, 1.98968, 1.60570, 3.14158, 2.14675, 3.14158])
+# the arm interface's initial guesses: straight, and the waist turned by -120 and 120 degrees
+SEEDS = np.zeros((3, 6))
+SEEDS[1, 0], SEEDS[2, 0] = np.deg2rad(-120), np.deg2rad(120)
+
+
+def pose_matrix(pose):
+    '''
+    [x, y, z, roll, pitch, yaw] -> 4x4 transform (static xyz Euler angles,
+    like the server's get_tf_mat)
+    '''
+    x, y, z, roll, pitch, yaw = pose
+    cr, sr, cp, sp, cy, sy = np.cos(roll), np.sin(roll), np.cos(pitch), np.sin(pitch), np.cos(yaw), np.sin(yaw)
+    T = np.eye(4)
+    T[:3, :3] = [[cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+                 [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+                 [-sp, cp * sr, cp * cr]]
+    T[:3, 3] = [x, y, z]
+    return T
+
+
+def solve_one(T):
+    for guess in SEEDS:
+        theta, success = mr.IKinSpace(SLIST, M, T, guess, 0.001, 0.001)
+        if success and np.all(theta >= LOWER_LIMITS) and np.all(theta <= UPPER_LIMITS):
+            return theta, True
+    return theta, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Single vs batched IK benchmark')
+    parser.add_argument('--poses', type=int, default=500, help='board poses to solve, spread over all of them')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    poses = calibration_poses()
+    poses = poses[np.linspace(0, len(poses) - 1, min(args.poses, len(poses))).astype(int)]
+    targets = np.array([pose_matrix(p) for p in poses])
+
+    start = time.monotonic()
+    single = [solve_one(T) for T in targets]
+    single_s = time.monotonic() - start
+
+    start = time.monotonic()
+    thetas, success = batch_ikin_seeds(SLIST, M, targets, SEEDS, LOWER_LIMITS, UPPER_LIMITS)
+    batch_s = time.monotonic() - start
+
+    single_success = np.array([ok for _, ok in single])
+    # solutions may differ by the branch taken, so compare where they land
+    errors = [np.linalg.norm(mr.FKinSpace(M, SLIST, theta)[:3, 3] - T[:3, 3])
+              for theta, ok, T in zip(thetas, success, targets) if ok]
+
+    print(f"poses: {len(targets)}")
+    print(f"single:  {single_s:7.3f}s  {len(targets) / single_s:9.0f} poses/s  solved {single_success.sum()}")
+    print(f"batched: {batch_s:7.3f}s  {len(targets) / batch_s:9.0f} poses/s  solved {success.sum()}")
+    print(f"speedup: {single_s / batch_s:.1f}x, max position error {max(errors) * 1000:.3f} mm")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "ik", "poses": len(targets),
+                       "single_seconds": single_s, "batch_seconds": batch_s,
+                       "single_solved": int(single_success.sum()), "batch_solved": int(success.sum())}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
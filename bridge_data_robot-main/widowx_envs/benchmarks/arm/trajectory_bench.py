@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+'''
+Arm time per chess move: the pick_and_place moves one pose at a time (the
+fixed move duration, and the same joint limits as the planner but stopping
+at every waypoint) against the blended trajectories of BLEND_PHASES, plus
+how far the blends cut the corners at the hover waypoints.
+
+Gripper time is left out, it is the same for all of them. Needs the
+widowx_controller package on the path, e.g.
+
+    PYTHONPATH=.:widowx_controller/src python benchmarks/arm/trajectory_bench.py --moves 200
+'''
+
+import argparse
+import json
+
+import chess
+import numpy as np
+
+from widowx_controller.batch_ik import batch_ikin_seeds, batch_fkin_space
+from widowx_controller.trajectory import plan_trajectory
+from widowx_envs.board_poses import SQUARE_XY, PIECE_HEIGHTS, CLEARANCE, piece_destinations
+from widowx_envs.pick_and_place import waypoints, BLEND_PHASES
+
+from ik_bench import SLIST, M, LOWER_LIMITS, UPPER_LIMITS, SEEDS, pose_matrix
+
+MOVE_DURATION = 1.0 # WidowXClient.move default
+# client.move calls of pick_and_place without recovery moves
+STEPWISE_POSES = ["home", "hover_pick", "hover_pick_rolled", "grasp", "hover_pick_rolled",
+                  "hover_place_rolled", "place", "hover_place_rolled", "hover_place", "clear_view"]
+
+
+def random_moves(count, seed=0):
+    '''
+    (from square, to square, piece type) of pieces moved to squares they can reach
+    '''
+    rng = np.random.default_rng(seed)
+    moves = []
+    while len(moves) < count:
+        piece_type = int(rng.choice(chess.PIECE_TYPES))
+        square = int(rng.integers(64))
+        destinations = piece_destinations(piece_type, square)
+        moves.append((square, int(rng.choice(destinations)), piece_type))
+    return moves
+
+
+def corner_deviation(trajectory, targets):
+    '''
+    Closest approach (m) of the end-effector to each intermediate waypoint
+    position of a trajectory
+    '''
+    _, positions, _ = trajectory.samples(500)
+    xyz = batch_fkin_space(M, SLIST, positions)[0][:, :3, 3]
+    return [np.min(np.linalg.norm(xyz - T[:3, 3], axis=1)) for T in targets[1:-1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stepwise vs blended pick and place trajectories')
+    parser.add_argument('--moves', type=int, default=200, help='random piece moves to time')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    fixed, stopping, blended, deviations = [], [], [], []
+    skipped = 0
+    for from_square, to_square, piece_type in random_moves(args.moves):
+        height = PIECE_HEIGHTS[chess.piece_symbol(piece_type).upper()]
+        poses = waypoints(SQUARE_XY[from_square], SQUARE_XY[to_square], height, height + CLEARANCE)
+        names = list(poses.keys())
+        targets = np.array([pose_matrix(poses[n]) for n in names])
+        thetas, success = batch_ikin_seeds(SLIST, M, targets, SEEDS, LOWER_LIMITS, UPPER_LIMITS)
+        if not np.all(success):
+            skipped += 1
+            continue
+        joints = dict(zip(names, thetas))
+
+        # every move starts where the last one ended
+        path = [joints["clear_view"]] + [joints[n] for n in STEPWISE_POSES]
+        fixed.append(MOVE_DURATION * len(STEPWISE_POSES))
+        stopping.append(sum(plan_trajectory([a, b]).duration for a, b in zip(path[:-1], path[1:])))
+
+        total, start = 0.0, joints["clear_view"]
+        for _, phase, _ in BLEND_PHASES:
+            trajectory = plan_trajectory([start] + [joints[n] for n in phase])
+            total += trajectory.duration
+            deviations += corner_deviation(trajectory, np.array([pose_matrix(poses[n]) for n in phase]))
+            start = joints[phase[-1]]
+        blended.append(total)
+
+    fixed, stopping, blended = np.mean(fixed), np.mean(stopping), np.mean(blended)
+    print(f"moves: {args.moves - skipped} ({skipped} without IK solution skipped)")
+    print(f"fixed {MOVE_DURATION:.1f}s moves:      {fixed:6.2f}s per move")
+    print(f"stop at each waypoint: {stopping:6.2f}s per move")
+    print(f"blended:               {blended:6.2f}s per move, {stopping / blended:.2f}x faster than stopping")
+    print(f"corner cut at hover waypoints: mean {np.mean(deviations) * 1000:.1f} mm, "
+          f"max {np.max(deviations) * 1000:.1f} mm")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "trajectory", "moves": args.moves - skipped,
+                       "fixed_seconds": fixed, "stopping_seconds": stopping, "blended_seconds": blended,
+                       "max_corner_mm": float(np.max(deviations) * 1000)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
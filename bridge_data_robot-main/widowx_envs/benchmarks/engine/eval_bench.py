@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+'''
+Evaluations per second of the three ways to score a position: summing the
+piece-square tables over the bitboards (evaluate_full), reading the score
+kept by make/unmake (evaluate), and NumPy batches (evaluate_batch).
+
+The positions are the leaves one ply below each benchmark position, which is
+what the search evaluates.
+
+    python benchmarks/engine/eval_bench.py --repeat 20 --batch 256
+'''
+
+import argparse
+import json
+import time
+
+from widowx_envs.engine import Position
+from widowx_envs.engine.evaluate import evaluate, evaluate_full, evaluate_batch
+
+from positions import SEARCH_POSITIONS
+
+
+def leaf_positions():
+    leaves = []
+    for _, fen in SEARCH_POSITIONS:
+        pos = Position(fen)
+        for move in pos.legal_moves():
+            pos.make(move)
+            leaves.append(Position(pos.fen()))
+            pos.unmake()
+    return leaves
+
+
+def timed(fn, repeat):
+    start = time.monotonic()
+    for _ in range(repeat):
+        fn()
+    return time.monotonic() - start
+
+
+def run(repeat=20, batch=256):
+    leaves = leaf_positions()
+    n = len(leaves) * repeat
+    batches = [leaves[i:i + batch] for i in range(0, len(leaves), batch)]
+
+    expected = [evaluate_full(pos) for pos in leaves]
+    assert [evaluate(pos) for pos in leaves] == expected
+    assert [int(s) for b in batches for s in evaluate_batch(b)] == expected
+
+    results = []
+    for name, fn in (
+        ("full", lambda: [evaluate_full(pos) for pos in leaves]),
+        ("incremental", lambda: [evaluate(pos) for pos in leaves]),
+        (f"batch{batch}", lambda: [evaluate_batch(b) for b in batches]),
+    ):
+        elapsed = timed(fn, repeat)
+        results.append({"name": name, "evals": n, "seconds": elapsed,
+                        "evals_per_sec": n / elapsed if elapsed else 0.0})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluation benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=256, help='positions per evaluate_batch call')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.batch)
+    base = results[0]["evals_per_sec"]
+    print(f"{'mode':<12} {'evals':>8} {'seconds':>9} {'evals/s':>12} {'speedup':>8}")
+    for res in results:
+        res["speedup"] = res["evals_per_sec"] / base if base else 0.0
+        print(f"{res['name']:<12} {res['evals']:>8} {res['seconds']:>9.3f} "
+              f"{res['evals_per_sec']:>12.0f} {res['speedup']:>8.1f}")
+
+    report = {"benchmark": "eval", "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
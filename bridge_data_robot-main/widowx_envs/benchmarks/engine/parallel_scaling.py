@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+'''
+Nodes per second of the root-split parallel search against worker count.
+
+Runs a fixed-depth search on a few middlegame positions with 1, 2, 4, ...
+workers (up to --max-workers) and prints a table plus JSON. Each worker count
+starts from an empty transposition table so the runs are comparable.
+
+    python benchmarks/engine/parallel_scaling.py --depth 5 --max-workers 16
+'''
+
+import argparse
+import json
+import os
+import time
+
+from widowx_envs.engine import Position
+from widowx_envs.engine.parallel import ParallelSearcher
+
+from positions import MIDDLEGAME_POSITIONS
+
+POSITIONS = [fen for _, fen in MIDDLEGAME_POSITIONS[:3]]
+
+
+def run(workers, depth):
+    nodes, elapsed = 0, 0.0
+    with ParallelSearcher(workers=workers) as searcher:
+        # start the pool outside the timed region
+        searcher.search(Position(POSITIONS[0]), depth=1)
+        for fen in POSITIONS:
+            searcher.tt.clear()
+            start = time.monotonic()
+            result = searcher.search(Position(fen), depth=depth)
+            elapsed += time.monotonic() - start
+            nodes += result.nodes
+    return {"workers": workers, "depth": depth, "nodes": nodes, "seconds": elapsed,
+            "nps": nodes / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel search scaling benchmark')
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    counts = []
+    n = 1
+    while n < args.max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(args.max_workers)
+
+    results = []
+    print(f"{'workers':>8} {'nodes':>10} {'seconds':>9} {'nodes/s':>10} {'speedup':>8}")
+    for workers in counts:
+        res = run(workers, args.depth)
+        res["speedup"] = (results[0]["seconds"] / res["seconds"]) if results else 1.0
+        results.append(res)
+        print(f"{workers:>8} {res['nodes']:>10} {res['seconds']:>9.2f} {res['nps']:>10.0f} {res['speedup']:>8.2f}")
+
+    report = {"benchmark": "parallel_scaling", "cpu_count": os.cpu_count(), "results": results}
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
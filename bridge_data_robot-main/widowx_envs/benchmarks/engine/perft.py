@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+'''
+Perft: count leaf nodes of the legal move tree and check them against the
+known counts, timing move generation plus make/unmake.
+
+    python benchmarks/engine/perft.py              # default depths
+    python benchmarks/engine/perft.py --depth 5    # cap every position at 5
+    python benchmarks/engine/perft.py --divide startpos --depth 3
+'''
+
+import argparse
+import json
+import sys
+import time
+
+from widowx_envs.engine import Position
+
+from positions import PERFT_POSITIONS, PERFT_DEFAULT_DEPTH
+
+
+def perft(pos, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in pos.generate_moves():
+        pos.make(move)
+        if pos.was_legal():
+            nodes += perft(pos, depth - 1) if depth > 1 else 1
+        pos.unmake()
+    return nodes
+
+
+def divide(pos, depth):
+    '''
+    Node count below every root move, for tracking down move generator bugs
+    '''
+    counts = {}
+    for move in pos.legal_moves():
+        pos.make(move)
+        counts[pos.to_chess_move(move).uci()] = perft(pos, depth - 1)
+        pos.unmake()
+    return counts
+
+
+def run(depth=None, names=None):
+    '''
+    Run perft on every position (or those in names) and return one result
+    dict per position
+    '''
+    results = []
+    for name, fen, expected in PERFT_POSITIONS:
+        if names and name not in names:
+            continue
+        d = min(depth, len(expected)) if depth else PERFT_DEFAULT_DEPTH[name]
+        pos = Position(fen)
+        start = time.monotonic()
+        nodes = perft(pos, d)
+        elapsed = time.monotonic() - start
+        results.append({
+            "name": name,
+            "depth": d,
+            "nodes": nodes,
+            "expected": expected[d - 1],
+            "ok": nodes == expected[d - 1],
+            "seconds": elapsed,
+            "nps": nodes / elapsed if elapsed else 0.0,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine perft benchmark')
+    parser.add_argument('--depth', type=int, default=None, help='perft depth, capped by the known counts')
+    parser.add_argument('--positions', nargs='*', default=None, help='position names to run')
+    parser.add_argument('--divide', type=str, default=None, help='print per-move counts for this position')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.divide:
+        fen = dict((name, fen) for name, fen, _ in PERFT_POSITIONS)[args.divide]
+        depth = args.depth or PERFT_DEFAULT_DEPTH[args.divide]
+        for move, count in sorted(divide(Position(fen), depth).items()):
+            print(f"{move}: {count}")
+        return
+
+    results = run(args.depth, args.positions)
+    print(f"{'position':<12} {'depth':>5} {'nodes':>10} {'seconds':>8} {'nodes/s':>9}  status")
+    for res in results:
+        status = "ok" if res["ok"] else f"FAIL (expected {res['expected']})"
+        print(f"{res['name']:<12} {res['depth']:>5} {res['nodes']:>10} {res['seconds']:>8.2f} "
+              f"{res['nps']:>9.0f}  {status}")
+
+    report = {"benchmark": "perft", "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if not all(res["ok"] for res in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
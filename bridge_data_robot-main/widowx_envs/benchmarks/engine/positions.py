@@ -0,0 +1,48 @@
+'''
+Positions shared by the engine benchmarks.
+'''
+
+# (name, fen, known perft node counts for depth 1, 2, ...), from the
+# chessprogramming wiki perft results page
+PERFT_POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+# default perft depth per position, small enough for a quick offline run
+PERFT_DEFAULT_DEPTH = {
+    "startpos": 4,
+    "kiwipete": 3,
+    "position3": 4,
+    "position4": 3,
+    "position5": 3,
+    "position6": 3,
+}
+
+MIDDLEGAME_POSITIONS = [
+    ("two_knights", "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+    ("giuoco_pianissimo", "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2PP1N2/PP3PPP/RNBQ1RK1 w - - 0 7"),
+    ("queens_gambit", "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 10"),
+    ("ruy_lopez_chigorin", "r1b2rk1/2q1bppp/p2p1n2/np2p3/3PP3/5N1P/PPBN1PP1/R1BQR1K1 w - - 0 13"),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+]
+
+ENDGAME_POSITIONS = [
+    ("pawn_opposition", "8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 1"),
+    ("pawn_race", "8/8/1p6/p1p5/P1P2k2/1P6/5K2/8 w - - 0 1"),
+    ("rook_endgame", "8/5pk1/6p1/8/3R4/6P1/5PK1/3r4 w - - 0 1"),
+    ("back_rank", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+]
+
+SEARCH_POSITIONS = MIDDLEGAME_POSITIONS + ENDGAME_POSITIONS
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+'''
+Run the perft and search benchmarks and write one JSON report, optionally
+comparing it against an earlier report to catch regressions.
+
+    python benchmarks/engine/run_all.py --out bench_engine.json
+    python benchmarks/engine/run_all.py --compare bench_engine.json
+
+Runs fully offline; the report records the git commit and python version
+so results from different engine changes can be told apart.
+'''
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import perft
+import search_bench
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    '''
+    Print the nodes/sec change of every benchmark found in both reports and
+    return the names that slowed down by more than threshold (a fraction)
+    '''
+    regressions = []
+    for section in ("perft", "search"):
+        old_results = dict((r["name"], r) for r in old.get(section, []))
+        for res in new[section]:
+            before = old_results.get(res["name"])
+            if before is None or not before["nps"]:
+                continue
+            change = res["nps"] / before["nps"] - 1.0
+            line = f"{section:<7} {res['name']:<20} {before['nps']:>9.0f} -> {res['nps']:>9.0f} nodes/s ({change:+.1%})"
+            if section == "search" and res["nodes"] != before["nodes"]:
+                line += f", nodes {before['nodes']} -> {res['nodes']}"
+            print(line)
+            if change < -threshold:
+                regressions.append(f"{section}/{res['name']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine benchmark suite')
+    parser.add_argument('--perft-depth', type=int, default=None)
+    parser.add_argument('--search-depth', type=int, default=5)
+    parser.add_argument('--out', type=str, default=None, help='write the JSON report here')
+    parser.add_argument('--compare', type=str, default=None, help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='nodes/sec drop counted as a regression (fraction)')
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "perft": perft.run(args.perft_depth),
+        "search": search_bench.run(args.search_depth),
+    }
+
+    failed = [res["name"] for res in report["perft"] if not res["ok"]]
+    for res in report["perft"]:
+        print(f"perft   {res['name']:<20} depth {res['depth']} {res['nodes']:>9} nodes "
+              f"{res['nps']:>9.0f} nodes/s {'ok' if res['ok'] else 'FAIL'}")
+    for res in report["search"]:
+        print(f"search  {res['name']:<20} depth {res['depth']} {res['nodes']:>9} nodes "
+              f"{res['nps']:>9.0f} nodes/s {res['seconds']:.2f}s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+'''
+Fixed-depth search benchmark on middlegame and endgame positions.
+
+Every position is searched with a fresh Searcher, reporting nodes, nodes per
+second, the time at which each iteration finished (time-to-depth) and memory.
+Memory is the process peak RSS plus, with --trace-memory, the peak python
+allocation of a second (slower, untimed) run under tracemalloc.
+
+    python benchmarks/engine/search_bench.py --depth 5
+    python benchmarks/engine/search_bench.py --positions back_rank rook_endgame
+'''
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from widowx_envs.engine import Position, Searcher
+from widowx_envs.engine.tt import ENTRY_BYTES
+
+from positions import SEARCH_POSITIONS, MIDDLEGAME_POSITIONS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(depth=5, names=None, tt_size_mb=32, trace_memory=False):
+    '''
+    Search every position (or those in names) and return one result dict
+    per position
+    '''
+    middlegame = set(name for name, _ in MIDDLEGAME_POSITIONS)
+    results = []
+    for name, fen in SEARCH_POSITIONS:
+        if names and name not in names:
+            continue
+        searcher = Searcher(tt_size_mb=tt_size_mb)
+        pos = Position(fen)
+        start = time.monotonic()
+        result = searcher.search(pos, depth=depth)
+        elapsed = time.monotonic() - start
+        entry = {
+            "name": name,
+            "phase": "middlegame" if name in middlegame else "endgame",
+            "depth": result.depth,
+            "move": pos.to_chess_move(result.move).uci() if result.move else None,
+            "score": result.score,
+            "nodes": result.nodes,
+            "seconds": elapsed,
+            "nps": result.nodes / elapsed if elapsed else 0.0,
+            "qnodes": searcher.qnodes,
+            "first_move_cutoff_rate": searcher.first_move_cutoff_rate,
+            "time_to_depth": [round(it.elapsed, 4) for it in searcher.iterations],
+            "tt_hit_rate": searcher.tt.stats()["hit_rate"],
+            "tt_bytes": searcher.tt.size * ENTRY_BYTES,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if trace_memory:
+            searcher = Searcher(tt_size_mb=tt_size_mb)
+            tracemalloc.start()
+            searcher.search(Position(fen), depth=depth)
+            entry["peak_alloc_mb"] = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+            tracemalloc.stop()
+        results.append(entry)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine fixed-depth search benchmark')
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--positions', nargs='*', default=None, help='position names to run')
+    parser.add_argument('--tt-mb', type=int, default=32)
+    parser.add_argument('--trace-memory', action='store_true', help='measure peak python allocations')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.depth, args.positions, args.tt_mb, args.trace_memory)
+    print(f"{'position':<20} {'move':<6} {'score':>6} {'nodes':>9} {'qnodes':>9} {'1st cut':>7} "
+          f"{'seconds':>8} {'nodes/s':>8}  time to depth")
+    for res in results:
+        ttd = " ".join(f"{t:.2f}" for t in res["time_to_depth"])
+        print(f"{res['name']:<20} {res['move'] or '-':<6} {res['score']:>6} {res['nodes']:>9} "
+              f"{res['qnodes']:>9} {res['first_move_cutoff_rate']:>7.0%} "
+              f"{res['seconds']:>8.2f} {res['nps']:>8.0f}  {ttd}")
+
+    report = {"benchmark": "search", "depth": args.depth, "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+'''
+Time the per-cell sum of the SSIM difference map: the old python double loop
+over every board pixel against one np.bincount over a precomputed label map.
+
+Runs on consecutive pairs of the saved camera frames in test_images, with the
+8x8 grid laid over the board's bounding box (no camera or AprilTags needed).
+
+    python benchmarks/vision/cell_diff.py --repeat 3
+'''
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import shapely.geometry as geom
+from skimage.metrics import structural_similarity
+
+from widowx_envs.cv import cell_label_map, sum_cells
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "test_images")
+
+# board bounding box in the 640x360 test frames, as (min_x, min_y, max_x, max_y)
+BOARD_BOUNDS = (160, 0, 540, 360)
+
+
+def make_grid(bounds):
+    min_x, min_y, max_x, max_y = bounds
+    grid_x = np.linspace(min_x, max_x, 9)
+    grid_y = np.linspace(min_y, max_y, 9)
+    return [geom.box(grid_x[ix], grid_y[iy], grid_x[ix + 1], grid_y[iy + 1])
+            for ix in range(8) for iy in range(8)]
+
+
+def loop_sums(diff, cells):
+    sums = []
+    for cell in cells:
+        min_x, min_y, max_x, max_y = cell.bounds
+        cell_diff = 0
+        for x in range(int(min_x), int(max_x)):
+            for y in range(int(min_y), int(max_y)):
+                cell_diff += diff[y][x]
+        sums.append(cell_diff)
+    return np.array(sums)
+
+
+def run(image_dir, repeat=3):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    frames = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2GRAY) for p in paths]
+    diffs = [structural_similarity(a, b, full=True)[1] for a, b in zip(frames, frames[1:])]
+    cells = make_grid(BOARD_BOUNDS)
+
+    start = time.monotonic()
+    labels = cell_label_map(diffs[0].shape, cells)
+    label_time = time.monotonic() - start
+
+    start = time.monotonic()
+    for _ in range(repeat):
+        expected = [loop_sums(diff, cells) for diff in diffs]
+    loop_time = (time.monotonic() - start) / (repeat * len(diffs))
+
+    start = time.monotonic()
+    for _ in range(repeat):
+        got = [sum_cells(diff, labels, len(cells)) for diff in diffs]
+    bincount_time = (time.monotonic() - start) / (repeat * len(diffs))
+
+    same = all(np.allclose(a, b) and np.array_equal(np.argsort(a)[:2], np.argsort(b)[:2])
+               for a, b in zip(expected, got))
+    return {
+        "images": len(frames),
+        "pairs": len(diffs),
+        "label_map_ms": label_time * 1000.0,
+        "loop_ms": loop_time * 1000.0,
+        "bincount_ms": bincount_time * 1000.0,
+        "speedup": loop_time / bincount_time if bincount_time else 0.0,
+        "same_cells": same,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-cell difference aggregation benchmark')
+    parser.add_argument('--images', type=str, default=DEFAULT_IMAGES, help='directory of .jpg frames')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    res = run(args.images, args.repeat)
+    print(f"{res['pairs']} frame pairs: python loop {res['loop_ms']:.1f} ms, "
+          f"bincount {res['bincount_ms']:.2f} ms per frame ({res['speedup']:.0f}x), "
+          f"label map built once in {res['label_map_ms']:.2f} ms, "
+          f"same moved cells: {res['same_cells']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+'''
+Replay recorded before/after board images through BoardView and the move
+inference, reporting the latency of every stage and how many of the labeled
+moves were detected. The occupancy classifier is calibrated on the first
+pair's before image and checked against the position after every move.
+
+A labels file lists the image directory, the board corners (h1, a1, a8, h8
+in pixels; without them the AprilTags in the images are used) and the pairs:
+
+    {"before": "...jpg", "after": "...jpg", "fen": "<position before>", "move": "e2e4"}
+
+    python benchmarks/vision/replay.py
+    python benchmarks/vision/replay.py --labels my_labels.json --repeat 5 --json replay.json
+    python benchmarks/vision/replay.py --metric ncc --cell-px 16
+    python benchmarks/vision/replay.py --cell-px 0  # full-size cells
+
+Exits with status 1 if any labeled move is missed, so it can be used as a
+regression check. The defaults (SSIM at 32 pixels per cell) detect every
+move of the bundled pairs; full-size SSIM cells miss one of them.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import chess
+import numpy as np
+
+from widowx_envs.cv import BoardView
+from widowx_envs.frame_source import ImageSource
+from widowx_envs.move_inference import MoveInference
+from widowx_envs.occupancy import OccupancyClassifier, reconcile
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_labels.json")
+
+STAGES = ("tags", "rectify", "diff", "cells", "inference", "occupancy")
+
+
+def set_corners(board_view, corners):
+    board_view.set_board([corners[0], corners[1], corners[2]],
+                         {BoardView.BoardTags.ROBOT_L.name: [corners[3]] * 4})
+
+
+def replay_pair(board_view, source, pair, corners, image_dir, occupancy):
+    '''
+    Run one labeled pair, returning the predicted move, its margin, the
+    squares the occupancy classifier got wrong after the labeled move and
+    the seconds spent in every stage
+    '''
+    before = os.path.join(image_dir, pair["before"])
+    after = os.path.join(image_dir, pair["after"])
+    timings = {}
+
+    source.seek(before)
+    if corners is not None:
+        set_corners(board_view, corners)
+    else:
+        board_view.locate_board()
+        timings["tags"] = board_view.timings["tags"]
+    board_view.update_board_state()
+    rectify = board_view.timings["rectify"]
+
+    source.seek(after)
+    changes = board_view.cell_changes()
+    timings["rectify"] = (rectify + board_view.timings["rectify"]) / 2.0
+    timings["diff"] = board_view.timings["diff"]
+    timings["cells"] = board_view.timings["cells"]
+
+    start = time.monotonic()
+    move, margin = MoveInference(chess.Board(pair["fen"])).infer(changes)
+    timings["inference"] = time.monotonic() - start
+
+    occupancy_errors = None
+    if pair.get("move") is not None:
+        board_image = board_view.read_board(color=True)
+        start = time.monotonic()
+        seen = occupancy.predict(board_view.square_blocks(board_image))
+        timings["occupancy"] = time.monotonic() - start
+        board = chess.Board(pair["fen"])
+        board.push_uci(pair["move"])
+        occupancy_errors = len(reconcile(board, seen))
+    return move, margin, occupancy_errors, timings
+
+
+def calibrate(board_view, source, pair, corners, image_dir):
+    '''
+    Occupancy classifier fit on the before image of pair
+    '''
+    source.seek(os.path.join(image_dir, pair["before"]))
+    if corners is not None:
+        set_corners(board_view, corners)
+    else:
+        board_view.locate_board()
+    board_image = board_view.read_board(color=True)
+    return OccupancyClassifier().fit(board_view.square_blocks(board_image), chess.Board(pair["fen"]))
+
+
+def run(labels_path, repeat=1, metric="ssim", cell_px=None):
+    with open(labels_path) as f:
+        labels = json.load(f)
+    image_dir = os.path.join(os.path.dirname(os.path.abspath(labels_path)), labels["images"])
+    corners = labels.get("corners")
+    paths = sorted(set(os.path.join(image_dir, p[k]) for p in labels["pairs"] for k in ("before", "after")))
+
+    source = ImageSource(paths)
+    board_view = BoardView(source=source, rectify=True, metric=metric, cell_px=cell_px)
+    results = []
+    try:
+        occupancy = calibrate(board_view, source, labels["pairs"][0], corners, image_dir)
+        for pair in labels["pairs"]:
+            stage_times = dict((stage, []) for stage in STAGES)
+            for _ in range(repeat):
+                move, margin, occupancy_errors, timings = replay_pair(board_view, source, pair, corners,
+                                                                      image_dir, occupancy)
+                for stage, seconds in timings.items():
+                    stage_times[stage].append(seconds)
+            results.append({
+                "before": pair["before"],
+                "after": pair["after"],
+                "expected": pair.get("move"),
+                "detected": move.uci() if move else None,
+                "correct": pair.get("move") is not None and move is not None and move.uci() == pair["move"],
+                "margin": margin,
+                "occupancy_errors": occupancy_errors,
+                "ms": dict((stage, float(np.mean(t)) * 1000.0) for stage, t in stage_times.items() if t),
+            })
+    finally:
+        board_view.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline vision replay benchmark')
+    parser.add_argument('--labels', type=str, default=DEFAULT_LABELS, help='labels JSON file')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per pair for the timings')
+    parser.add_argument('--metric', type=str, default='ssim', choices=['ssim', 'ncc'])
+    parser.add_argument('--cell-px', type=int, default=32,
+                        help='compare at this many pixels per cell, 0 for full-size cells')
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.labels, args.repeat, args.metric, args.cell_px or None)
+    print(f"{'before':<22} {'after':<22} {'expected':<8} {'detected':<8} {'margin':>6} {'occ err':>7}  "
+          + " ".join(f"{stage:>9}" for stage in STAGES))
+    for res in results:
+        times = " ".join(f"{res['ms'][stage]:>7.2f}ms" if stage in res["ms"] else f"{'-':>9}" for stage in STAGES)
+        print(f"{res['before']:<22} {res['after']:<22} {res['expected'] or '-':<8} {res['detected'] or '-':<8} "
+              f"{res['margin']:>6.2f} {'-' if res['occupancy_errors'] is None else res['occupancy_errors']:>7}  "
+              f"{times}")
+
+    labeled = [res for res in results if res["expected"] is not None]
+    correct = sum(res["correct"] for res in labeled)
+    print(f"moves detected: {correct}/{len(labeled)}")
+    print(f"occupancy: {sum(res['occupancy_errors'] for res in labeled)} of {64 * len(labeled)} squares wrong")
+    stage_ms = dict((stage, float(np.mean([res["ms"][stage] for res in results if stage in res["ms"]])))
+                    for stage in STAGES if any(stage in res["ms"] for res in results))
+    print("mean per stage: " + ", ".join(f"{stage} {ms:.2f}ms" for stage, ms in stage_ms.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "vision_replay", "accuracy": correct / len(labeled) if labeled else None,
+                       "stage_ms": stage_ms, "pairs": results}, f, indent=2)
+    if correct < len(labeled):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#! /usr/bin/python3
+"""
+Inverse kinematics for many target poses at once.
+
+The same Newton iteration in the space frame as ModifiedIKinSpace (and
+modern_robotics.IKinSpace), written over stacks of poses: forward
+kinematics, space Jacobians and twist errors are computed for every entry
+with NumPy, and the steps are damped least squares solves
+(J^T (J J^T + damping^2 I)^-1 V) done with one batched np.linalg.solve.
+Entries that have converged are masked out of later iterations.
+
+Screw axes follow modern_robotics: Slist has one column per joint, twists
+are [angular, linear].
+"""
+
+import numpy as np
+
+
+def _skew(v):
+    """(N, 3) vectors -> (N, 3, 3) skew symmetric matrices"""
+    zero = np.zeros(len(v))
+    return np.stack([np.stack([zero, -v[:, 2], v[:, 1]], axis=-1),
+                     np.stack([v[:, 2], zero, -v[:, 0]], axis=-1),
+                     np.stack([-v[:, 1], v[:, 0], zero], axis=-1)], axis=1)
+
+
+def batch_exp6(screw, theta):
+    """
+    exp([screw] * theta) for one screw axis (6,) and N joint angles, (N, 4, 4)
+    """
+    omega, v = screw[:3], screw[3:]
+    n = len(theta)
+    T = np.zeros((n, 4, 4))
+    T[:, 3, 3] = 1.0
+    if np.linalg.norm(omega) < 1e-6:
+        # prismatic joint
+        T[:, :3, :3] = np.eye(3)
+        T[:, :3, 3] = theta[:, None] * v
+        return T
+    w = _skew(np.broadcast_to(omega, (1, 3)))[0]
+    w2 = w @ w
+    sin, cos = np.sin(theta)[:, None, None], np.cos(theta)[:, None, None]
+    T[:, :3, :3] = np.eye(3) + sin * w + (1 - cos) * w2
+    G = np.eye(3) * theta[:, None, None] + (1 - cos) * w + (theta[:, None, None] - sin) * w2
+    T[:, :3, 3] = G @ v
+    return T
+
+
+def batch_adjoint(T):
+    """(N, 4, 4) transforms -> (N, 6, 6) adjoint representations"""
+    R, p = T[:, :3, :3], T[:, :3, 3]
+    Ad = np.zeros((len(T), 6, 6))
+    Ad[:, :3, :3] = R
+    Ad[:, 3:, 3:] = R
+    Ad[:, 3:, :3] = _skew(p) @ R
+    return Ad
+
+
+def batch_trans_inv(T):
+    """(N, 4, 4) transforms -> their inverses"""
+    R, p = T[:, :3, :3], T[:, :3, 3]
+    inv = np.zeros_like(T)
+    Rt = np.swapaxes(R, 1, 2)
+    inv[:, :3, :3] = Rt
+    inv[:, :3, 3] = -(Rt @ p[:, :, None])[:, :, 0]
+    inv[:, 3, 3] = 1.0
+    return inv
+
+
+def batch_log6(T):
+    """
+    Matrix logarithms of (N, 4, 4) transforms as (N, 6) twists
+    [angular, linear], like se3ToVec(MatrixLog6(T))
+    """
+    R, p = T[:, :3, :3], T[:, :3, 3]
+    n = len(T)
+    twists = np.zeros((n, 6))
+    cos = np.clip((np.trace(R, axis1=1, axis2=2) - 1) / 2.0, -1.0, 1.0)
+    theta = np.arccos(cos)
+
+    pure_translation = cos >= 1 - 1e-12
+    twists[pure_translation, 3:] = p[pure_translation]
+
+    rotating = ~pure_translation
+    if not np.any(rotating):
+        return twists
+    Rr, th = R[rotating], theta[rotating]
+    omega = np.zeros((len(Rr), 3))
+    near_pi = np.sin(th) < 1e-6
+    general = ~near_pi
+    # log of R: theta / (2 sin theta) (R - R^T)
+    scale = th[general] / (2 * np.sin(th[general]))
+    omega[general] = scale[:, None] * np.stack([Rr[general, 2, 1] - Rr[general, 1, 2],
+                                                Rr[general, 0, 2] - Rr[general, 2, 0],
+                                                Rr[general, 1, 0] - Rr[general, 0, 1]], axis=-1)
+    for i in np.flatnonzero(near_pi):
+        # rotations by pi, as in MatrixLog3
+        Ri = Rr[i]
+        if abs(1 + Ri[2, 2]) >= 1e-6:
+            axis = np.array([Ri[0, 2], Ri[1, 2], 1 + Ri[2, 2]]) / np.sqrt(2 * (1 + Ri[2, 2]))
+        elif abs(1 + Ri[1, 1]) >= 1e-6:
+            axis = np.array([Ri[0, 1], 1 + Ri[1, 1], Ri[2, 1]]) / np.sqrt(2 * (1 + Ri[1, 1]))
+        else:
+            axis = np.array([1 + Ri[0, 0], Ri[1, 0], Ri[2, 0]]) / np.sqrt(2 * (1 + Ri[0, 0]))
+        omega[i] = np.pi * axis
+
+    omgmat = _skew(omega)
+    th = th[:, None, None]
+    G_inv = np.eye(3) - omgmat / 2.0 + (1.0 / th - 1.0 / np.tan(th / 2.0) / 2.0) * (omgmat @ omgmat) / th
+    twists[rotating, :3] = omega
+    twists[rotating, 3:] = (G_inv @ p[rotating][:, :, None])[:, :, 0]
+    return twists
+
+
+def batch_fkin_space(M, Slist, thetas):
+    """
+    End-effector poses (N, 4, 4) for joint angles thetas (N, n), and the
+    products of the first i joint exponentials (n, N, 4, 4) used by the
+    space Jacobian
+    """
+    n = len(thetas)
+    T = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+    partial = []
+    for i in range(Slist.shape[1]):
+        partial.append(T)
+        T = T @ batch_exp6(Slist[:, i], thetas[:, i])
+    return T @ M, partial
+
+
+def batch_jacobian_space(Slist, partial):
+    """
+    Space Jacobians (N, 6, n) from the partial products of batch_fkin_space
+    """
+    return np.stack([(batch_adjoint(P) @ Slist[:, i]) for i, P in enumerate(partial)], axis=-1)
+
+
+def batch_ikin_space(Slist, M, targets, guesses, eomg=0.001, ev=0.001, max_iterations=40, damping=1e-3):
+    """
+    Joint angles reaching every target pose (N, 4, 4) starting from
+    guesses (N, n). Returns (thetas (N, n), success (N,)), success meaning
+    the angular and linear errors fell below eomg and ev. damping keeps the
+    steps finite at singular configurations, such as the all-zero guess.
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    thetas = np.array(guesses, dtype=np.float64)
+    success = np.zeros(len(thetas), dtype=bool)
+    active = np.arange(len(thetas))
+    for i in range(max_iterations + 1):
+        Tsb, partial = batch_fkin_space(M, Slist, thetas[active])
+        Vs = (batch_adjoint(Tsb) @ batch_log6(batch_trans_inv(Tsb) @ targets[active])[:, :, None])[:, :, 0]
+        converged = (np.linalg.norm(Vs[:, :3], axis=1) <= eomg) & (np.linalg.norm(Vs[:, 3:], axis=1) <= ev)
+        success[active[converged]] = True
+        keep = ~converged
+        active, Vs = active[keep], Vs[keep]
+        if len(active) == 0 or i == max_iterations:
+            break
+        J = batch_jacobian_space(Slist, [P[keep] for P in partial])
+        Jt = np.swapaxes(J, 1, 2)
+        # damped least squares step, the pseudo-inverse step for damping -> 0
+        A = J @ Jt + (damping ** 2) * np.eye(6)
+        thetas[active] += (Jt @ np.linalg.solve(A, Vs[:, :, None]))[:, :, 0]
+    return thetas, success
+
+
+def batch_ikin_seeds(Slist, M, targets, seeds, lower_limits=None, upper_limits=None, **kwargs):
+    """
+    Solve every target (N, 4, 4) from every seed (K, n) in a single batch
+    and keep, per target, the first seed whose solution converged within
+    the joint limits. Returns (thetas (N, n), success (N,)).
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    seeds = np.asarray(seeds, dtype=np.float64)
+    n, k = len(targets), len(seeds)
+    # seed-major so reshape(k, n, ...) groups the solutions of each seed
+    thetas, success = batch_ikin_space(Slist, M, np.tile(targets, (k, 1, 1)), np.repeat(seeds, n, axis=0),
+                                       **kwargs)
+    if lower_limits is not None:
+        success &= np.all(thetas >= lower_limits, axis=1)
+    if upper_limits is not None:
+        success &= np.all(thetas <= upper_limits, axis=1)
+    thetas, success = thetas.reshape(k, n, -1), success.reshape(k, n)
+    first = np.argmax(success, axis=0)
+    return thetas[first, np.arange(n)], success.any(axis=0)
@@ -0,0 +1,174 @@
+#! /usr/bin/python3
+"""
+Joint-space trajectories through a list of waypoints, for streaming to the
+arm at a fixed rate instead of stopping at every waypoint.
+
+The trajectory is piecewise linear in joint space with parabolic blends
+(linear segments with parabolic blends, LSPB): every joint moves at constant
+velocity between waypoints and changes velocity with constant acceleration
+in a blend centred on each waypoint, so the arm rounds the intermediate
+waypoints instead of stopping at them. It starts and ends at rest exactly
+on the first and last waypoint. The joints are synchronised: each segment
+takes as long as its slowest joint needs, within the per-joint velocity and
+acceleration limits. Where a blend would cut a corner by more than a
+tolerance, the arm stops on that waypoint instead.
+"""
+
+import numpy as np
+
+# per-joint limits for the wx250s (waist, shoulder, elbow, forearm_roll,
+# wrist_angle, wrist_rotate), rad/s and rad/s^2, well under what the servos
+# manage so that a carried piece stays in the gripper
+JOINT_VELOCITY_LIMITS = np.array([1.5, 1.2, 1.5, 2.0, 2.0, 2.5])
+JOINT_ACCELERATION_LIMITS = np.array([3.0, 2.5, 3.0, 5.0, 5.0, 6.0])
+# furthest any joint may pass from an intermediate waypoint (rad). Over the
+# board that is up to about 3 cm at the gripper, so a piece lifted by
+# board_poses.CLEARANCE (10 cm) still clears its neighbours when the lift
+# and the carry are blended
+CORNER_TOLERANCE = 0.12
+
+MIN_SEGMENT_TIME = 1e-3
+
+
+class JointTrajectory():
+    """
+    Positions q(t) for t in [0, duration] of a planned trajectory.
+
+    waypoints (K, n) are passed through by the linear segments at times (K,),
+    velocities (K + 1, n) are the segment velocities, with rest before the
+    first and after the last waypoint, and blends (K,) are the durations of
+    the parabolic blends centred on the waypoints.
+    """
+
+    def __init__(self, waypoints, times, velocities, blends):
+        self.waypoints = waypoints
+        self.times = times
+        self.velocities = velocities
+        self.blends = blends
+        self.accelerations = (velocities[1:] - velocities[:-1]) / np.maximum(blends, MIN_SEGMENT_TIME)[:, None]
+
+    @property
+    def duration(self):
+        return self.times[-1] + self.blends[-1] / 2
+
+    def sample(self, t):
+        """
+        Positions and velocities at times t (scalar or (N,)), as (N, n) arrays
+        """
+        t = np.clip(np.atleast_1d(np.asarray(t, dtype=np.float64)), 0.0, self.duration)
+        # the waypoint whose blend or outgoing segment contains t
+        k = np.clip(np.searchsorted(self.times - self.blends / 2, t, side="right") - 1, 0, len(self.times) - 1)
+        dt = (t - self.times[k])[:, None]
+        start = (self.times[k] - self.blends[k] / 2)[:, None]
+        in_blend = (t[:, None] < start + self.blends[k][:, None])
+        tau = np.where(in_blend, t[:, None] - start, 0.0)
+        # on the line through waypoint k with the velocity before it, bent by the blend acceleration
+        v_in = self.velocities[k]
+        a = self.accelerations[k]
+        line_out = self.waypoints[k] + self.velocities[k + 1] * dt
+        blend = self.waypoints[k] + v_in * dt + 0.5 * a * tau ** 2
+        positions = np.where(in_blend, blend, line_out)
+        velocities = np.where(in_blend, v_in + a * tau, self.velocities[k + 1])
+        return positions, velocities
+
+    def samples(self, rate):
+        """
+        (times, positions, velocities) every 1 / rate seconds, ending with
+        the final waypoint
+        """
+        times = np.append(np.arange(0.0, self.duration, 1.0 / rate), self.duration)
+        positions, velocities = self.sample(times)
+        return times, positions, velocities
+
+
+def _segment_times(deltas, velocity_limits, acceleration_limits):
+    """
+    Time for each segment (K - 1,) from rest to rest with the slowest joint
+    at its limits: the trapezoid of its velocity limit, or the triangle of its
+    acceleration limit for short moves. Only the cruise part is returned, the
+    blends add the rest.
+    """
+    distance = np.abs(deltas)
+    cruise = distance / velocity_limits
+    bang_bang = np.sqrt(distance / acceleration_limits)
+    return np.maximum(np.max(np.maximum(cruise, bang_bang), axis=1), MIN_SEGMENT_TIME)
+
+
+def _blends(velocities, acceleration_limits):
+    """
+    Blend durations: as short as the joint with the largest velocity change allows
+    """
+    return np.max(np.abs(np.diff(velocities, axis=0)) / acceleration_limits, axis=1)
+
+
+def _corner_cuts(velocities, blends):
+    """
+    How far (rad) each blend passes from its waypoint, |velocity change| *
+    blend / 8 for the furthest joint. Zero where the arm is at rest on either
+    side, it stops on those waypoints.
+    """
+    moving = np.any(velocities != 0, axis=1)
+    cuts = np.max(np.abs(np.diff(velocities, axis=0)), axis=1) * blends / 8
+    cuts[~(moving[:-1] & moving[1:])] = 0.0
+    return cuts
+
+
+def _time_waypoints(waypoints, velocity_limits, acceleration_limits, max_iterations):
+    """
+    JointTrajectory through waypoints with the shortest segments whose
+    blends fit between them
+    """
+    deltas = np.diff(waypoints, axis=0)
+    segments = _segment_times(deltas, velocity_limits, acceleration_limits)
+    rest = np.zeros((1, waypoints.shape[1]))
+    for i in range(max_iterations + 1):
+        velocities = np.vstack([rest, deltas / segments[:, None], rest])
+        blends = _blends(velocities, acceleration_limits)
+        # neighbouring blends have to fit in the segment between them
+        needed = (blends[:-1] + blends[1:]) / 2
+        overlap = needed > segments * (1 + 1e-9)
+        if not np.any(overlap):
+            break
+        if i < max_iterations:
+            # slowing a segment down shortens its blends, for a single segment
+            # this lands on the time optimal triangle profile in one step
+            segments[overlap] = np.maximum(np.sqrt(segments[overlap] * needed[overlap]), needed[overlap] * 0.5) * 1.001
+        else:
+            # still overlapping: slow everything down until the blends fit
+            while np.any(needed > segments):
+                segments *= 1.1
+                velocities = np.vstack([rest, deltas / segments[:, None], rest])
+                blends = _blends(velocities, acceleration_limits)
+                needed = (blends[:-1] + blends[1:]) / 2
+    times = blends[0] / 2 + np.concatenate([[0.0], np.cumsum(segments)])
+    return JointTrajectory(waypoints, times, velocities, blends)
+
+
+def plan_trajectory(waypoints, velocity_limits=JOINT_VELOCITY_LIMITS,
+                    acceleration_limits=JOINT_ACCELERATION_LIMITS, corner_tolerance=CORNER_TOLERANCE,
+                    max_iterations=100):
+    """
+    JointTrajectory through waypoints (K, n) of joint angles within the
+    velocity (n,) and acceleration (n,) limits. The arm blends past
+    intermediate waypoints, unless the blend would pass further than
+    corner_tolerance from one (None for no bound): it stops on that one.
+    Repeated waypoints are dropped.
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64)
+    velocity_limits = np.asarray(velocity_limits, dtype=np.float64)
+    acceleration_limits = np.asarray(acceleration_limits, dtype=np.float64)
+    keep = np.ones(len(waypoints), dtype=bool)
+    keep[1:] = np.any(np.abs(np.diff(waypoints, axis=0)) > 1e-9, axis=1)
+    waypoints = waypoints[keep]
+    if len(waypoints) == 1:
+        return JointTrajectory(waypoints, np.zeros(1), np.zeros((2, waypoints.shape[1])), np.zeros(1))
+
+    trajectory = _time_waypoints(waypoints, velocity_limits, acceleration_limits, max_iterations)
+    while corner_tolerance is not None:
+        cutting = np.flatnonzero(_corner_cuts(trajectory.velocities, trajectory.blends) > corner_tolerance)
+        if len(cutting) == 0:
+            break
+        # a repeated waypoint is a stop: the segment between the copies has zero velocity
+        waypoints = np.insert(waypoints, cutting, waypoints[cutting], axis=0)
+        trajectory = _time_waypoints(waypoints, velocity_limits, acceleration_limits, max_iterations)
+    return trajectory
@@ -31,6 +31,7 @@ import widowx_envs.utils.transformation_utils as tr
 
 from widowx_controller.custom_gripper_controller import GripperController
 from widowx_controller.controller_base import RobotControllerBase
+from widowx_controller.batch_ik import batch_ikin_seeds
 
 import numpy as np
 from numba import jit
@@ -44,6 +45,13 @@ NEUTRAL_JOINT_STATE = np.array([-0.13192235, -0.76238847,  0.44485444,
 DEFAULT_ROTATION = np.array([[0 , 0, 1.0],
                              [0, 1.0,  0],
                              [-1.0,  0, 0]])
+# a motion is complete once every joint is this close to its target (rad)
+# and slower than this (rad/s) for a few joint state messages in a row
+POSITION_TOLERANCE = 0.02
+VELOCITY_TOLERANCE = 0.05
+SETTLE_SAMPLES = 3
+# position commands per second when streaming a planned trajectory
+TRAJECTORY_RATE = 50
 
 ##############################################################################
 
@@ -264,20 +272,102 @@ class WidowX_Controller(RobotControllerBase):
             #     print(f"Robot moved to "+target_pose+" .")
 
             if check_effort:
-                if np.max(np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS) > 10:
-                    print('violation ', np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS)
-                    print('motor number: ', np.argmax(np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS))
-                    print('max effort reached: ', self.get_joint_effort())
-                    print('max effort allowed ', ABS_MAX_JOINT_EFFORTS)
-                    self.open_gripper()
-                    self.move_to_neutral()
-                    raise Environment_Exception
+                self.check_joint_effort()
 
         except rospy.service.ServiceException:
             print('stuck during move')
             import pdb; pdb.set_trace()
             self.move_to_neutral()
     
+    def check_joint_effort(self):
+        '''
+        Open the gripper, go to neutral and raise Environment_Exception if a
+        joint pushes harder than ABS_MAX_JOINT_EFFORTS allows, e.g. the
+        gripper pressing into the board. Meaningful once the arm got where it
+        was sent.
+        '''
+        if np.max(np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS) > 10:
+            print('violation ', np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS)
+            print('motor number: ', np.argmax(np.abs(self.get_joint_effort()) - ABS_MAX_JOINT_EFFORTS))
+            print('max effort reached: ', self.get_joint_effort())
+            print('max effort allowed ', ABS_MAX_JOINT_EFFORTS)
+            self.open_gripper()
+            self.move_to_neutral()
+            raise Environment_Exception
+
+    def solve_ik_batch(self, target_poses):
+        '''
+        Joint angles reaching a stack of target poses (N x 4 x 4) in one
+        batch without moving, every pose tried from all of the arm's initial
+        guesses. Returns (N x joint
+        angles, N successes).
+        '''
+        arm = self.bot.arm
+        return batch_ikin_seeds(arm.robot_des.Slist, arm.robot_des.M, target_poses, arm.initial_guesses,
+                                self._lower_joint_limits, self._upper_joint_limits)
+
+    def move_to_joint_angles(self, target_positions, duration=2, blocking=True):
+        '''
+        Move straight to known joint angles (e.g. a cached IK solution) with
+        the same trajectory timing as move_to_eep
+        '''
+        self.set_moving_time(moving_time=duration)
+        success = self.bot.arm.set_joint_positions(list(target_positions), moving_time=duration,
+                                                   accel_time=duration * 0.45, blocking=blocking)
+        if success is False:
+            print('joint angles out of limits, do nothing')
+            raise Environment_Exception
+        self.des_joint_angles = list(target_positions)
+
+    def follow_joint_trajectory(self, trajectory, rate=TRAJECTORY_RATE):
+        '''
+        Stream a planned trajectory.JointTrajectory to the arm, one position
+        command every 1 / rate seconds, returning once the last one is sent.
+        Commands are sampled at the wall time since the start, so a late
+        tick does not slow the motion down.
+        '''
+        arm = self.bot.arm
+        moving_time, accel_time = arm.moving_time, arm.accel_time
+        # the servos interpolate each command over a couple of periods, short enough to track the stream
+        arm.set_trajectory_time(moving_time=2.0 / rate, accel_time=0.5 / rate)
+        try:
+            ticker = rospy.Rate(rate)
+            start = time.time()
+            while not rospy.is_shutdown():
+                t = time.time() - start
+                if t >= trajectory.duration:
+                    break
+                positions, _ = trajectory.sample(t)
+                arm.publish_positions_fast(positions[0])
+                ticker.sleep()
+            arm.publish_positions_fast(trajectory.waypoints[-1])
+            self.des_joint_angles = list(trajectory.waypoints[-1])
+        finally:
+            arm.set_trajectory_time(moving_time=moving_time, accel_time=accel_time)
+
+    def wait_until_joint_positions_reached(self, target_positions, timeout=5.0,
+                                           position_tolerance=POSITION_TOLERANCE,
+                                           velocity_tolerance=VELOCITY_TOLERANCE):
+        '''
+        Block until the joint states show the arm stopped at target_positions.
+        Returns False if that did not happen within timeout seconds.
+        '''
+        target_positions = np.asarray(target_positions)
+        deadline = time.time() + timeout
+        settled = 0
+        while time.time() < deadline:
+            angles, velocities = self.get_joint_angles(), self.get_joint_angles_velocity()
+            if angles is not None and velocities is not None and \
+                    np.max(np.abs(angles - target_positions)) < position_tolerance and \
+                    np.max(np.abs(velocities)) < velocity_tolerance:
+                settled += 1
+                if settled >= SETTLE_SAMPLES:
+                    return True
+            else:
+                settled = 0
+            time.sleep(0.01)
+        return False
+
     def set_joint_angles(self, target_positions, duration=4):
         target_positions_to_reach = [target_positions]
         if len(target_positions_to_reach) > 1000:
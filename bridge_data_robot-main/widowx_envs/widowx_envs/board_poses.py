@@ -0,0 +1,86 @@
+'''
+Where the robot finds the squares, the pieces and the capture tray, and
+every pose pick_and_place can visit while playing chess, for precomputing
+their inverse kinematics (see ik_cache).
+'''
+
+import chess
+import numpy as np
+
+from widowx_envs.pick_and_place import waypoints
+
+A1 = (0.45, -0.15)  # xy of A1 tile which is the 0th index in python-chess
+FILE_STEP = 0.0444 # 0.0434
+RANK_STEP = 0.0434
+
+# each index represents a tile from a1 to h8
+SQUARE_XY = [(A1[0] - file * FILE_STEP, A1[1] + rank * RANK_STEP) for file in range(8) for rank in range(8)]
+
+# Height dictionary
+PIECE_HEIGHTS = {'P' : 0.004,
+                 'N' : 0.000,
+                 'B' : 0.006,
+                 'R' : 0.005,
+                 'Q' : 0.025,
+                 'K' : 0.032,}
+
+CLEARANCE = 0.1 # carried pieces are lifted this far above their height
+
+# captured pieces go in rows of CAPTURES_PER_ROW next to the board
+CAPTURES_PER_ROW = 3
+CAPTURE_OFFSET = 0.05
+CAPTURE_SLOTS = 15 # every piece but the king
+
+
+def tray_xy(captures):
+    '''
+    xy of the capture tray slot for the piece captured after captures others
+    '''
+    return (0.18 + (captures // CAPTURES_PER_ROW) * CAPTURE_OFFSET,
+            0.2 + (captures % CAPTURES_PER_ROW) * CAPTURE_OFFSET)
+
+
+def piece_destinations(piece_type, square):
+    '''
+    Squares a piece of piece_type (of either colour) on square can move to
+    on some board: its attacks on an empty board, plus pawn pushes and
+    castling
+    '''
+    destinations = set()
+    for color in chess.COLORS:
+        board = chess.Board.empty()
+        board.set_piece_at(square, chess.Piece(piece_type, color))
+        destinations |= set(board.attacks(square))
+        if piece_type == chess.PAWN:
+            step = 8 if color == chess.WHITE else -8
+            start_rank = 1 if color == chess.WHITE else 6
+            if 0 <= square + step < 64:
+                destinations.add(square + step)
+            if chess.square_rank(square) == start_rank:
+                destinations.add(square + 2 * step)
+        elif piece_type == chess.KING and square == (chess.E1 if color == chess.WHITE else chess.E8):
+            destinations |= {square - 2, square + 2}
+    return sorted(destinations)
+
+
+def calibration_poses():
+    '''
+    Every distinct pose of every pick_and_place the bot can make: each piece
+    moved from each square to each square it could reach, or to any capture
+    tray slot. An N x 6 array of [x, y, z, roll, pitch, yaw].
+    '''
+    poses = {}
+
+    def add(xy_initial, xy_final, height):
+        for pose in waypoints(xy_initial, xy_final, height, height + CLEARANCE).values():
+            poses.setdefault(tuple(pose.tolist()), pose)
+
+    for piece_type in chess.PIECE_TYPES:
+        height = PIECE_HEIGHTS[chess.piece_symbol(piece_type).upper()]
+        for square in chess.SQUARES:
+            for destination in piece_destinations(piece_type, square):
+                add(SQUARE_XY[square], SQUARE_XY[destination], height)
+            if piece_type != chess.KING:
+                for slot in range(CAPTURE_SLOTS):
+                    add(SQUARE_XY[square], tray_xy(slot), height)
+    return np.array(list(poses.values()))
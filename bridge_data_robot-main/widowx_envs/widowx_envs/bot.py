@@ -8,52 +8,112 @@ import time
 import chess
 from widowx_envs.widowx_env_service import WidowXClient, WidowXConfigs, WidowXStatus
 from widowx_envs.pick_and_place import pick_and_place
-import sys
-import os
-# Add the 'chess-ai' directory to the Python path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../chess-ai')))
-import minimax
+from widowx_envs.engine import Searcher, SearchResult, Ponderer
+from widowx_envs.engine.book import OpeningBook
+from widowx_envs.engine.tablebase import Tablebase, WDL_SCORES
+from widowx_envs.engine import search as engine_search
+from widowx_envs.engine.parallel import ParallelSearcher, parallel_search
 # from widowx_envs.cv import BoardView
 from widowx_envs.cv import BoardView
+from widowx_envs.move_watcher import MoveWatcher
+from widowx_envs.move_inference import MoveInference
+from widowx_envs.board_poses import SQUARE_XY, PIECE_HEIGHTS, CLEARANCE, tray_xy, calibration_poses
+from widowx_envs.occupancy import OccupancyClassifier, reconcile, describe_mismatches, best_matching_moves
 import inspect
 
 print_yellow = lambda x: print("\033[93m {}\033[00m" .format(x))
 
-A1 = (0.45, -0.15)  # xy of A1 tile which is the 0th index in python-chess
-initial_tile = A1
-poses = [] # each index represents a tile from a1 to h8
-
-# Populate poses list
-for file in range(8):
-    file_step = file * 0.0444 # 0.0434
-    for rank in range(8):
-        rank_step = rank * 0.0434
-        poses.append((initial_tile[0] - file_step, initial_tile[1] + rank_step))
-
-# Height dictionary
-heights = {'P' : 0.004,
-           'N' : 0.000,
-           'B' : 0.006,
-           'R' : 0.005,
-           'Q' : 0.025,
-           'K' : 0.032,}
+poses = SQUARE_XY # each index represents a tile from a1 to h8
+heights = PIECE_HEIGHTS
 
 board = chess.Board()
 
 
+def move_piece(client, xy_initial, xy_final, height, clearance_height, client_side=False, blend=False):
+    '''
+    Pick and place a piece with a single request that the server runs
+    locally, or step by step from here with client_side. blend moves in
+    planned trajectories through the hover waypoints. True if every step
+    of it succeeded.
+    '''
+    start = time.monotonic()
+    if client_side:
+        timer = pick_and_place(xy_initial=xy_initial, xy_final=xy_final, height=height,
+                               clearance_height=clearance_height, client=client, blend=blend, verbose=False)
+        status = timer.status
+        motion = sum(m for _, _, m in timer.segments if m is not None)
+    else:
+        status = client.pick_place(xy_initial, xy_final, height, clearance_height, blend=blend)
+        motion = client.last_motion_time or 0.0
+    print(f"Pick and place took {time.monotonic() - start:.1f}s, {motion:.1f}s of it moving")
+    ik = client.ik_cache_stats
+    if ik is not None and ik["hit_rate"] is not None:
+        print(f"IK cache: {ik['hit_rate']:.0%} hits, {ik['saved_seconds']:.2f}s of IK saved")
+    if status != WidowXStatus.SUCCESS:
+        print_yellow(f"Pick and place failed (status {status})")
+        return False
+    return True
+
 
 def main():
     captures = 0
     parser = argparse.ArgumentParser(description='Robot Chess Player for the WidowX-200')
     parser.add_argument('--ip', type=str, default='localhost')
     parser.add_argument('--port', type=int, default=5556)
+    parser.add_argument('--depth', type=int, default=None,
+                        help='engine search depth in plies (5 by default, the depth cap with --think-ms)')
+    parser.add_argument('--think-ms', type=int, default=None,
+                        help='engine think time per move in milliseconds, deepens until it runs out')
+    parser.add_argument('--tt-mb', type=int, default=32, help='transposition table size in MB')
+    parser.add_argument('--no-ponder', action='store_true', help="don't search during the player's turn")
+    parser.add_argument('--workers', type=int, default=1, help='engine processes, >1 splits the search')
+    parser.add_argument('--book', type=str, default=None, help='Polyglot .bin opening book to play from')
+    parser.add_argument('--syzygy', type=str, default=None, help='directory of Syzygy endgame tablebases')
+    parser.add_argument('--rectify', action='store_true',
+                        help='warp the board to a square image with a homography instead of rotating frames')
+    parser.add_argument('--cell-px', type=int, default=None,
+                        help='compare board images at this many pixels per square (e.g. 32) instead of full size')
+    parser.add_argument('--diff-metric', type=str, default='ssim', choices=['ssim', 'ncc'],
+                        help='how board images are compared to find the moved squares')
+    parser.add_argument('--snapshot-frames', type=int, default=1,
+                        help='average this many frames for each board image that is compared')
+    parser.add_argument('--snapshot', type=str, default='mean', choices=['mean', 'median'],
+                        help='how the frames of a board snapshot are combined')
+    parser.add_argument('--client-side-moves', action='store_true',
+                        help='send every step of a pick and place separately instead of one request')
+    parser.add_argument('--blend', action='store_true',
+                        help='move pieces in planned joint-space trajectories that blend through the hover poses')
+    parser.add_argument('--calibrate-ik', action='store_true',
+                        help="solve IK for every board pose up front (server needs --ik-cache)")
+    parser.add_argument('--auto-move', action='store_true',
+                        help="detect the end of the player's move from the camera instead of waiting for Enter")
     args = parser.parse_args()
 
     client = WidowXClient(host=args.ip, port=args.port)
     client.init(WidowXConfigs.DefaultEnvParams, image_size=256)
     print("Starting robot.")
-
-    board_view = BoardView()
+    if args.calibrate_ik:
+        start = time.monotonic()
+        status = client.calibrate_ik(calibration_poses())
+        print(f"IK calibration {'done' if status == WidowXStatus.SUCCESS else 'incomplete'} "
+              f"in {time.monotonic() - start:.1f}s: {client.ik_cache_stats}")
+
+    board_view = BoardView(rectify=args.rectify, cell_px=args.cell_px, metric=args.diff_metric,
+                           snapshot_frames=args.snapshot_frames, snapshot=args.snapshot)
+    move_watcher = MoveWatcher(board_view) if args.auto_move else None
+    occupancy = OccupancyClassifier() # calibrated on the starting position
+    parallel_searcher = None
+    if args.workers > 1:
+        parallel_searcher = ParallelSearcher(workers=args.workers, tt_size_mb=args.tt_mb,
+                                             tablebase_dir=args.syzygy)
+        searcher = parallel_searcher.searcher # shares the workers' hash table
+        tablebase = parallel_searcher.tablebase
+    else:
+        tablebase = Tablebase(args.syzygy) if args.syzygy else None
+        searcher = Searcher(tt_size_mb=args.tt_mb, tablebase=tablebase) # kept for the whole game so the hash table is reused
+    ponderer = Ponderer(searcher, depth=args.depth, think_ms=args.think_ms)
+    book = OpeningBook(args.book) if args.book else None
+    search_times = [] # seconds spent in engine searches, to estimate what the book saves
 
     is_open = 1
     try:
@@ -61,6 +121,10 @@ def main():
         client.move(np.array([0.1, 0, 0.15, 0, 1.5, 0]),blocking=True)
         while playing:
             post_capture = False
+            if board.is_game_over():
+                # e.g. the bot's move was mate, there is no player's move to wait for
+                print_yellow(f"Game over: {board.result()}")
+                break
             # view_thread = threading.Thread(target = board_view.show_frame)
             # view_thread.start()
 
@@ -69,9 +133,20 @@ def main():
             input("enter when arm is ready")
 
 
-            board_view.locate_board(True)
+            board_view.locate_board()
+            print(f"Board: {board_view.roi_detections} tracked / {board_view.full_detections} full-frame "
+                  f"tag detections, grid built {board_view.geometry_builds} times")
             board_view.update_board_state()
 
+            # check that the pieces on the board match the game
+            board_blocks = board_view.square_blocks(board_view.read_board(color=True))
+            if not occupancy.calibrated and board.board_fen() == chess.STARTING_BOARD_FEN:
+                occupancy.fit(board_blocks, board)
+            elif occupancy.calibrated:
+                mismatches = reconcile(board, occupancy.predict(board_blocks))
+                if mismatches:
+                    print_yellow(f"Board check: {describe_mismatches(mismatches)}")
+
             
             time.sleep(1)
             
@@ -80,6 +155,7 @@ def main():
                 for move in board.legal_moves
             ]
             print(f"Availabe Moves: {legal_moves_lst}")
+            move_inference = MoveInference(board) # the player's candidate moves, ready before they move
 
             # print_yellow("Enter moves as [x y] where x is the index of the square the piece starts at, and y is the square the piece moves to.")
             print_yellow("Enter moves as their algebraic notation. For example, moving a Pawn from e2 to e4 would be <e4>, and moving a Knight from b1 to c3 is <Nc3> (without the <>)" )
@@ -87,7 +163,12 @@ def main():
             valid_input = False
             # while not valid_input:
             ## Player's move ##
-            input("Enter when finished playing the move. White's move: ")
+            if move_watcher is not None:
+                print_yellow("White's move: play it, the camera will notice when your hand leaves the board")
+                move_watcher.wait_for_move()
+                print(f"Move detected {move_watcher.settle_latency:.2f}s after the board went still")
+            else:
+                input("Enter when finished playing the move. White's move: ")
             
             # move validation - use when running without camera
             # not yet integrated with CV move detection
@@ -107,39 +188,72 @@ def main():
 
 
             # determine player move based on camera feed
-            time.sleep(2)
-
-            cell1, cell2 = board_view.find_moved_piece()
-
-            print(cell1, cell2)
-
-            piece1 = board.piece_at(chess.parse_square(cell1))
-            piece2 = board.piece_at(chess.parse_square(cell2))
-
-            print(piece1)
-            print(piece2)
-
-           #  print(piece1.color)
-
-            if piece1 and piece1.color == chess.WHITE:
-                piece = piece1
-                player_from_square = chess.parse_square(cell1)
-                player_to_square = chess.parse_square(cell2)
-            else:
-                player_from_square = chess.parse_square(cell2)
-                piece = piece2
-                player_to_square = chess.parse_square(cell1)
-            
+            if move_watcher is None:
+                time.sleep(2)
+
+            # give the CPU back to move detection
+            ponderer.stop()
+
+            # the legal move whose squares changed the most
+            player_move, margin = move_inference.infer(board_view.cell_changes())
+            if player_move is None:
+                print_yellow(f"No legal moves, game over: {board.result()}")
+                break
+            if occupancy.calibrated and player_move is not None:
+                # overrule it if another move explains the pieces now on the board better
+                seen = occupancy.predict(board_view.square_blocks(board_view.read_board(color=True)))
+                ranked = best_matching_moves(board, seen, move_inference.moves)
+                if ranked[0][1] < dict(ranked)[player_move]:
+                    print_yellow(f"Pieces match {board.san(ranked[0][0])} better than {board.san(player_move)}")
+                    player_move = ranked[0][0]
+
+            cam_stats = board_view.grabber.stats()
+            print(f"Camera: {cam_stats['frames']} frames, {cam_stats['dropped']} dropped, "
+                  f"{cam_stats['failures']} failed reads")
+            print(f"Player move: {board.san(player_move)} (margin {margin:.2f})")
     
-            board.push(chess.Move(player_from_square, player_to_square))
+            board.push(player_move)
 
             print(board)
+            if board.is_game_over():
+                print_yellow(f"Game over: {board.result()}")
+                break
             
-            # Get the move of the bot
-            minmax = minimax.Minimax(board)
-            score, bot_move = minmax.alpha_beta_min(
-                5, float("-inf"), float("inf"), chess.Move.null()
-            )
+            # Get the move of the bot: from the tablebase, the book, pondered during the player's turn, or searched
+            result = None
+            if tablebase is not None:
+                tb_result = tablebase.root_move(board)
+                if tb_result is not None:
+                    tb_move, wdl = tb_result
+                    result = SearchResult(tb_move, WDL_SCORES[wdl], 0, 0, 0.0, [tb_move])
+                    print_yellow(f"Tablebase move: wdl {wdl}, {tablebase.hits} hits / {tablebase.probes} probes")
+            if result is None and book is not None:
+                book_move = book.choose(board)
+                if book_move is not None:
+                    result = SearchResult(book_move, 0, 0, 0, 0.0, [book_move])
+                    avg_search = sum(search_times) / len(search_times) if search_times \
+                        else (args.think_ms or 0) / 1000.0
+                    print_yellow(f"Book move: {book.hits} book moves this game, "
+                                 f"~{book.hits * avg_search:.1f}s of engine time saved")
+            if result is None and not args.no_ponder:
+                result = ponderer.result_for(board.peek())
+                if result is not None:
+                    print_yellow(f"Ponder hit on {board.peek()}")
+                print(f"Ponder: {ponderer.hits} hits / {ponderer.hits + ponderer.misses} moves "
+                      f"({ponderer.hit_rate:.0%})")
+            if result is None:
+                if parallel_searcher is not None:
+                    result = parallel_search(board, parallel_searcher, depth=args.depth, think_ms=args.think_ms)
+                else:
+                    result = engine_search(board, depth=args.depth, think_ms=args.think_ms, searcher=searcher)
+                search_times.append(result.elapsed)
+            bot_move = result.move
+            print(f"Engine: {board.san(bot_move)} score {result.score} depth {result.depth} "
+                  f"nodes {result.nodes} in {result.elapsed:.2f}s")
+            tt_stats = searcher.tt.stats()
+            print(f"TT: hits {tt_stats['hits']} misses {tt_stats['misses']} "
+                  f"collisions {tt_stats['collisions']} hit rate {tt_stats['hit_rate']:.1%} "
+                  f"full {tt_stats['hashfull'] / 10:.1f}%")
             
             # Play the move on the physical board
 
@@ -153,50 +267,59 @@ def main():
                 
 
                 height = heights[board.piece_at(bot_to_square).symbol().upper()]
-                clearance_height = height + 0.1
-
-                captures_per_row = 3
-                offset = 0.05
+                clearance_height = height + CLEARANCE
 
-                x_position = 0.18 + (captures // captures_per_row) * offset
-                y_position = 0.2 + (captures % captures_per_row) * offset
+                x_position, y_position = tray_xy(captures)
 
                 print(f"height: {height}")
                 print(f"x_pos: {x_position}")
                 print(f"y_pos: {y_position}")
 
-                pick_and_place(xy_initial=poses[bot_to_square],
-                            xy_final=(x_position, y_position),
-                            height=height,
-                            clearance_height=clearance_height, 
-                            client=client)
+                if not move_piece(client, xy_initial=poses[bot_to_square],
+                                  xy_final=(x_position, y_position),
+                                  height=height,
+                                  clearance_height=clearance_height,
+                                  client_side=args.client_side_moves, blend=args.blend):
+                    input(f"Move the captured piece on {chess.square_name(bot_to_square)} "
+                          "to the tray by hand, then press Enter")
 
                 captures += 1
                 print(f"Capturing on {bot_move.to_square}")
                 post_capture = True
 
             height = heights[board.piece_at(bot_from_square).symbol().upper()]
-            clearance_height = height + 0.1
-            pick_and_place(xy_initial=poses[bot_from_square], 
-                           xy_final=poses[bot_to_square], 
-                           height=height, 
-                           clearance_height=clearance_height, 
-                           client=client,
-                           post_capture=post_capture)
+            clearance_height = height + CLEARANCE
+            if not move_piece(client, xy_initial=poses[bot_from_square],
+                              xy_final=poses[bot_to_square],
+                              height=height,
+                              clearance_height=clearance_height,
+                              client_side=args.client_side_moves, blend=args.blend):
+                input(f"Finish {board.san(bot_move)} by hand, then press Enter")
 
             # Update virtual board model
             board.push(bot_move)
             print(board)
             print_yellow("Move played.")
 
+            if not args.no_ponder:
+                expected = result.pv[1] if len(result.pv) > 1 else None
+                ponderer.start(board, expected=expected)
+
             if cv2.waitKey(1) == ord("q"):
                 playing = False
 
 
-        board_view.cap.release()
+        board_view.close()
         cv2.destroyAllWindows
 
     except KeyboardInterrupt:
+        ponderer.stop()
+        if parallel_searcher is not None:
+            parallel_searcher.close()
+        if book is not None:
+            book.close()
+        if tablebase is not None and parallel_searcher is None:
+            tablebase.close()
         time.sleep(1)
         client.reset()
         time.sleep(1)
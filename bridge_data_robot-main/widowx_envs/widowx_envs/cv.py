@@ -1,3 +1,4 @@
+import chess
 import cv2
 import apriltag
 import numpy as np
@@ -6,14 +7,89 @@ from shapely.prepared import prep
 from skimage.metrics import structural_similarity
 from enum import Enum
 import time
+
+from widowx_envs.frame_grabber import FrameGrabber
+from widowx_envs.frame_source import VideoSource
+
+
+def cell_label_map(shape, cells):
+    '''
+    Label image of the given (height, width) where each pixel holds the
+    index of the cell (a shapely Polygon, in the order given) whose bounds
+    contain it, and len(cells) outside all cells
+    '''
+    labels = np.full(shape, len(cells), dtype=np.int32)
+    for i, cell in enumerate(cells):
+        min_x, min_y, max_x, max_y = (max(int(v), 0) for v in cell.bounds)
+        labels[min_y:max_y, min_x:max_x] = i
+    return labels
+
+
+def sum_cells(image, labels, n_cells):
+    '''
+    Sum of image over each labelled cell in one pass, as an array of n_cells
+    '''
+    sums = np.bincount(labels.ravel(), weights=image.ravel(), minlength=n_cells + 1)
+    return sums[:n_cells]
+
+
+def ncc_map(a, b, win=7):
+    '''
+    Local normalized cross-correlation of two grayscale images over win x win
+    windows: 1 where the structure is unchanged, lower where it changed.
+    Box filters only, so much cheaper than SSIM; unlike SSIM it ignores
+    uniform brightness changes. Flat windows are stabilized like in SSIM.
+    '''
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    c = (0.03 * 255) ** 2 / 2
+    mean = lambda x: cv2.boxFilter(x, -1, (win, win))
+    mean_a, mean_b = mean(a), mean(b)
+    var_a = np.maximum(mean(a * a) - mean_a * mean_a, 0)
+    var_b = np.maximum(mean(b * b) - mean_b * mean_b, 0)
+    cov = mean(a * b) - mean_a * mean_b
+    return (cov + c) / (np.sqrt(var_a * var_b) + c)
+
+
+DIFF_METRICS = ("ssim", "ncc")
+SNAPSHOT_MODES = ("mean", "median")
  
 
 class BoardView():
+    '''
+    Camera view of the chess board.
+
+    By default frames are rotated by a fixed angle and an axis-aligned grid
+    is laid over the bounding box of the board corners. With rectify=True,
+    locate_board instead computes a homography from the AprilTag corners and
+    every frame is warped to a warp_size x warp_size image of just the board,
+    with h1 at the top left and a8 at the bottom right, so each cell is a
+    fixed block of pixels.
+
+    Tags found once are tracked: later detections only search small regions
+    around their last positions, falling back to the full frame when a tag
+    is lost, and the board geometry is only rebuilt when a board corner has
+    moved more than drift_tolerance pixels.
+
+    Frames come from source, the webcam by default; see frame_source for
+    video files and recorded images. The duration of the last run of each
+    processing stage is kept in timings.
+
+    Move detection compares only the board: frames are cropped to it and,
+    with cell_px, scaled so every cell is cell_px x cell_px pixels. metric
+    picks the comparison, "ssim" or the cheaper "ncc" (see ncc_map).
+
+    The saved board state and the image compared with it are snapshots:
+    the mean (or median, with snapshot="median") of snapshot_frames
+    consecutive frames, so sensor noise and exposure flicker do not look
+    like moves. Each snapshot takes snapshot_frames frame periods.
+    '''
     # ids and locations of april tags
     class BoardTags(Enum):
         PLAYER_R = 98
         PLAYER_L = 99
         ROBOT_R = 97
+        ROBOT_L = 96 # optional, see locate_board
     
     # index of the relevant corner of each april tag
     class BoardCorners(Enum):
@@ -21,8 +97,42 @@ class BoardView():
         PLAYER_L = 1
         ROBOT_R = 3
 
-    def __init__(self):
-        self.cap = cv2.VideoCapture(0) # check num for webcam
+    ROBOT_L_CORNER = 0
+
+    def __init__(self, source=None, rectify=False, warp_size=400, drift_tolerance=3.0, track_margin=1.0,
+                 cell_px=None, metric="ssim", snapshot_frames=1, snapshot="mean"):
+        if metric not in DIFF_METRICS:
+            raise ValueError("metric must be one of {}".format(DIFF_METRICS))
+        if snapshot not in SNAPSHOT_MODES:
+            raise ValueError("snapshot must be one of {}".format(SNAPSHOT_MODES))
+        if not 1 <= snapshot_frames <= 256:
+            # the mean is summed in 16 bits
+            raise ValueError("snapshot_frames must be between 1 and 256")
+        self.rectify = rectify
+        self.cell_px = cell_px
+        self.metric = metric
+        self.snapshot_frames = snapshot_frames
+        self.snapshot = snapshot
+        # snapshot buffers, allocated for the board image size on first use
+        self._accumulator = None
+        self._frame_stack = None
+        self._snapshot = None
+        # whole pixels per cell; with cell_px the board is warped straight to that resolution
+        self.warp_size = 8 * cell_px if cell_px else warp_size // 8 * 8
+        self.homography = None
+
+        self.detector = apriltag.Detector()
+        self.tag_dict = {} # last seen corners of each tag
+        self.track_margin = track_margin # tracking window padding, in tag sizes
+        self.drift_tolerance = drift_tolerance
+        self.board_corners = None # board corners the current geometry was built from
+        # localization counters
+        self.roi_detections = 0
+        self.full_detections = 0
+        self.geometry_builds = 0
+        self.timings = {} # seconds of the last tags / rectify / diff / cells stage
+
+        self.cap = source if source is not None else VideoSource(0) # check num for webcam
 
         _, self.init_frame = self.cap.read()
         # _, self.init_frame = self.cap.read()
@@ -39,6 +149,19 @@ class BoardView():
         self.last_frame = self.frame
 
         self.board_cells = {}
+        self.cell_labels = None # label image of board_cells, see cell_label_map
+        self.board_bounds = None # (min_x, min_y, max_x, max_y) of the board in read frames
+
+        # keeps the newest camera frame so reads never come from a stale buffer
+        self.grabber = FrameGrabber(self.cap, threaded=self.cap.live)
+        self.grabber.start()
+
+    def close(self):
+        '''
+        Stop the capture thread and release the camera
+        '''
+        self.grabber.stop()
+        self.cap.release()
     
 
     def show_frame(self):
@@ -48,33 +171,66 @@ class BoardView():
         running = True
 
         while running:
-            _, view_frame = self.cap.read()
+            _, view_frame = self.grabber.read()
             cv2.imshow("test", view_frame)
 
             if cv2.waitKey(1) == ord("q"):
                 running = False
 
-        self.cap.release()
+        self.close()
         cv2.destroyAllWindows()
 
     
-    def __find_tags(self):
+    def __detect(self, image, offset=(0, 0)):
         '''
-        Find apriltags visible in image and save corners to tag_dict
+        Detect board tags in image, returning corners in frame coordinates
         '''
-        detector = apriltag.Detector()
-        _, self.init_frame = self.cap.read()
-        self.init_frame = self.__rotate_frame(self.init_frame, 25)
-        self.frame = cv2.cvtColor(self.init_frame, cv2.COLOR_BGR2GRAY)
-
-        april_tags = detector.detect(self.frame)
+        tag_ids = set(t.value for t in self.BoardTags)
+        tag_dict = {}
+        for tag in self.detector.detect(image):
+            if tag.tag_id in tag_ids:
+                tag_dict[self.BoardTags(tag.tag_id).name] = tag.corners + offset
+        return tag_dict
 
+    def __track_tags(self):
+        '''
+        Look for every known tag only in a window around where it was last
+        seen. Returns None as soon as one is not found there.
+        '''
         tag_dict = {}
+        for name, corners in self.tag_dict.items():
+            min_x, min_y = corners.min(axis=0)
+            max_x, max_y = corners.max(axis=0)
+            pad = max(max_x - min_x, max_y - min_y) * self.track_margin
+            x0, y0 = max(int(min_x - pad), 0), max(int(min_y - pad), 0)
+            x1, y1 = min(int(max_x + pad) + 1, self.W), min(int(max_y + pad) + 1, self.H)
+            found = self.__detect(np.ascontiguousarray(self.frame[y0:y1, x0:x1]), (x0, y0))
+            if name not in found:
+                return None
+            tag_dict[name] = found[name]
+        return tag_dict
 
-        for tag in april_tags:
-            # print(tag.tag_id)
-            tag_dict[self.BoardTags(tag.tag_id).name] = tag.corners
+    def __find_tags(self):
+        '''
+        Find apriltags visible in image and save corners to tag_dict
+        '''
+        _, self.init_frame = self.grabber.read(newer_than=time.monotonic())
+        start = time.monotonic()
+        if not self.rectify:
+            self.init_frame = self.__rotate_frame(self.init_frame, 25)
+        self.frame = cv2.cvtColor(self.init_frame, cv2.COLOR_BGR2GRAY)
 
+        tag_dict = None
+        if all(c.name in self.tag_dict for c in self.BoardCorners):
+            tag_dict = self.__track_tags()
+            if tag_dict is not None:
+                self.roi_detections += 1
+        if tag_dict is None:
+            tag_dict = self.__detect(self.frame)
+            self.full_detections += 1
+
+        self.tag_dict = tag_dict
+        self.timings["tags"] = time.monotonic() - start
         # print(tag_dict)
         return tag_dict
     
@@ -89,6 +245,40 @@ class BoardView():
         
         return board_corners
 
+    def __get_homography(self, tag_dict, corners):
+        '''
+        Perspective transform from the camera frame to the rectified board.
+        The player's tags are h1 and a1 and the robot's right tag is a8; h8
+        comes from the robot's left tag if it was seen, otherwise it is
+        estimated by completing the parallelogram (an affine fit).
+        '''
+        h1, a1, a8 = (np.float32(c) for c in corners)
+        if self.BoardTags.ROBOT_L.name in tag_dict:
+            h8 = np.float32(tag_dict[self.BoardTags.ROBOT_L.name][self.ROBOT_L_CORNER])
+        else:
+            h8 = h1 + a8 - a1
+        size = self.warp_size
+        src = np.float32([h1, a1, a8, h8])
+        dst = np.float32([[0, 0], [size, 0], [size, size], [0, size]])
+        return cv2.getPerspectiveTransform(src, dst)
+
+    def __read_frame(self, color=False):
+        '''
+        Grab a frame captured after this call and return it in grayscale
+        (BGR with color), rotated or rectified
+        '''
+        _, frame = self.grabber.read(newer_than=time.monotonic())
+        start = time.monotonic()
+        if not color:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.rectify:
+            # only the board area is computed
+            frame = cv2.warpPerspective(frame, self.homography, (self.warp_size, self.warp_size))
+        else:
+            frame = self.__rotate_frame(frame, 25)
+        self.timings["rectify"] = time.monotonic() - start
+        return frame
+
     def __create_grid(self, corners):
         '''
         From corners of board, create board grid
@@ -98,6 +288,7 @@ class BoardView():
 
         square = geom.Polygon(corners)
         min_x, min_y, max_x, max_y = square.bounds
+        self.board_bounds = tuple(max(int(v), 0) for v in square.bounds)
 
         grid_x = np.linspace(min_x, max_x, nx)
         grid_y = np.linspace(min_y, max_y, ny)
@@ -144,6 +335,51 @@ class BoardView():
         # print(self.board_cells.keys())
         # print(self.board_cells.values())
 
+        # precompute which pixels of the board crop belong to which cell so cell sums are
+        # one numpy pass; rectified or scaled board images have equal blocks instead
+        self.cell_labels = None
+        if not self.rectify and not self.cell_px:
+            min_x, min_y, max_x, max_y = self.board_bounds
+            labels = cell_label_map((self.H, self.W), list(self.board_cells.values()))
+            self.cell_labels = labels[min_y:max_y, min_x:max_x]
+
+    def __board_image(self, frame):
+        '''
+        Crop a rotated frame to the board and scale it to cell_px per cell.
+        Rectified frames are already just the board.
+        '''
+        if self.rectify or self.board_bounds is None:
+            return frame
+        min_x, min_y, max_x, max_y = self.board_bounds
+        frame = frame[min_y:max_y, min_x:max_x]
+        if self.cell_px:
+            frame = cv2.resize(frame, (8 * self.cell_px, 8 * self.cell_px), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def cell_scores(self, image):
+        '''
+        Sum of a board image (e.g. an SSIM diff map) over every board cell, by name
+        '''
+        start = time.monotonic()
+        if self.cell_labels is None:
+            # cells are equal blocks: [rank][file] sums, transposed to the board_cells order
+            h, w = image.shape[0] // 8, image.shape[1] // 8
+            sums = image.reshape(8, h, 8, w).sum(axis=(1, 3)).T.ravel()
+        else:
+            sums = sum_cells(image, self.cell_labels, len(self.board_cells))
+        self.timings["cells"] = time.monotonic() - start
+        return dict(zip(self.board_cells, sums))
+
+    def square_blocks(self, image):
+        '''
+        Split a board image (see read_board) into its 64 cells as one array
+        of shape (64, h, w[, channels]) indexed by chess square (a1 = 0)
+        '''
+        h, w = image.shape[0] // 8, image.shape[1] // 8
+        blocks = image[:8 * h, :8 * w].reshape((8, h, 8, w) + image.shape[2:]).swapaxes(1, 2)
+        # blocks are [rank][column] and columns run from the h file to the a file
+        return blocks[:, ::-1].reshape((64, h, w) + image.shape[2:])
+
     
     def locate_board(self):
         '''
@@ -151,75 +387,142 @@ class BoardView():
         '''
         tag_dict = self.__find_tags()
         
-        while(len(tag_dict) != 3):
+        while not all(c.name in tag_dict for c in self.BoardCorners):
             print(len(tag_dict))
             print("Incorrect number of Apriltags detected")
 
             tag_dict = self.__find_tags()
         
-        corners = self.__get_corners(tag_dict)
+        self.set_board(self.__get_corners(tag_dict), tag_dict)
+
+    def set_board(self, corners, tag_dict=None):
+        '''
+        Build the board geometry from the h1, a1 and a8 corners (and h8 from
+        tag_dict, when rectifying) in camera frame pixels. locate_board calls
+        this with the corners of the tags; recorded images without tags can
+        pass measured corners directly.
+        '''
+        if self.board_corners is not None and \
+                np.max(np.linalg.norm(np.array(corners) - self.board_corners, axis=1)) <= self.drift_tolerance:
+            # board has not moved, keep the grid and transform
+            return
+        self.board_corners = np.array(corners)
+        self.geometry_builds += 1
+
+        if self.rectify:
+            self.homography = self.__get_homography(tag_dict or {}, corners)
+            size = self.warp_size
+            corners = [[0, 0], [size, 0], [size, size], [0, size]]
+        self.board_cells = {}
         self.__create_grid(corners)
     
     
+    def read_board(self, scale=1.0, color=False):
+        '''
+        Fresh grayscale (or BGR) frame cropped to the board (once located)
+        and resized by scale, for cheap continuous watching of the board
+        '''
+        frame = self.__board_image(self.__read_frame(color))
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def __snapshot(self):
+        '''
+        Board image averaged over snapshot_frames consecutive frames. With
+        more than one frame the result is an internal buffer that the next
+        snapshot overwrites.
+        '''
+        frame = self.__board_image(self.__read_frame())
+        k = self.snapshot_frames
+        if k == 1:
+            return frame
+        if self._snapshot is None or self._snapshot.shape != frame.shape:
+            self._snapshot = np.empty(frame.shape, dtype=np.uint8)
+            if self.snapshot == "median":
+                self._frame_stack = np.empty((k,) + frame.shape, dtype=np.uint8)
+            else:
+                self._accumulator = np.empty(frame.shape, dtype=np.uint16)
+
+        for i in range(k):
+            if i > 0:
+                frame = self.__board_image(self.__read_frame())
+            if self.snapshot == "median":
+                self._frame_stack[i] = frame
+            elif i == 0:
+                np.copyto(self._accumulator, frame)
+            else:
+                np.add(self._accumulator, frame, out=self._accumulator)
+
+        if self.snapshot == "median":
+            # in place: the middle frame of the stack ends up holding the per-pixel median
+            self._frame_stack.partition(k // 2, axis=0)
+            np.copyto(self._snapshot, self._frame_stack[k // 2])
+        else:
+            self._accumulator += k // 2 # round to nearest
+            np.floor_divide(self._accumulator, k, out=self._snapshot, casting="unsafe")
+        return self._snapshot
+
     def update_board_state(self):
         '''
         Capture and store image of board state for later comparison
         '''
         # print("taking new image!!")
 
-        # only updates every 4 captures read, ensures new image is taken
-        for _ in range(4):
-            self.cap.read()
-
-        _, frame = self.cap.read()
-        frame = self.__rotate_frame(frame, 25)
-        self.last_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.last_frame = self.__snapshot().copy()
     
-    def find_moved_piece(self):
+    def __diff(self):
         '''
-        Compare current image to previous image to find where the player moved
+        Similarity map (SSIM or NCC) between the saved board state and a
+        fresh snapshot of the board, low where the board changed
         '''
-        for _ in range(4):
-            self.cap.read()
-
-        _, init_frame = self.cap.read()
-        init_frame = self.__rotate_frame(init_frame, 25)
-        new_frame = cv2.cvtColor(init_frame, cv2.COLOR_BGR2GRAY)
+        new_frame = self.__snapshot()
+
+        start = time.monotonic()
+        if self.metric == "ncc":
+            diff = ncc_map(self.last_frame, new_frame)
+        else:
+            _, diff = structural_similarity(self.last_frame, \
+                new_frame, full = True)
+        self.timings["diff"] = time.monotonic() - start
+        return diff
+
+    def cell_changes(self):
+        '''
+        How much every square changed since update_board_state, as an array
+        indexed by chess square (a1 = 0), higher for more change. Input for
+        move_inference.MoveInference.
+        '''
+        cell_diffs = self.cell_scores(self.__diff())
+        return -np.array([cell_diffs[name] for name in chess.SQUARE_NAMES])
 
-        _, diff = structural_similarity(self.last_frame, \
-            new_frame, full = True)
+    def find_moved_piece(self, show=True):
+        '''
+        Compare current image to previous image to find where the player moved.
+        With show, the difference image is displayed until a key is pressed.
+        '''
+        diff = self.__diff()
 
         # cv2.imshow('Difference', diff)
 
-        cell_diffs = {}
-
-        for cell_name, cell in self.board_cells.items():
-            exterior_pts = cell.exterior.coords
-            pts = np.array(exterior_pts, np.int32)
-            pts = pts.reshape((-1, 1, 2))
-
-            min_x, min_y, max_x, max_y = cell.bounds
-            cell_diff = 0
-
-            for x in range(int(min_x), int(max_x)):
-                for y in range(int(min_y), int(max_y)):
-                    cell_diff += diff[y][x]
-            
-            cell_diffs[cell_name] = cell_diff
+        cell_diffs = self.cell_scores(diff)
         
         # print(cell_diffs)
         sorted_cells = sorted(cell_diffs, key = cell_diffs.get)
 
-        for i in range(0, 2):
-            ext_pts = self.board_cells[sorted_cells[i]].exterior.coords
-            pts = np.array(ext_pts, np.int32)
-            pts = pts.reshape((-1, 1, 2))
-            cv2.polylines(diff, [pts], True, (0, 0, 255), 5) # draw square
-        
-        # display diff with player move squares drawn on
-        cv2.imshow('diff', diff)
-        cv2.waitKey(0)  # wait for 0 key to be pressed
-        cv2.destroyAllWindows()  # close image window
+        if show:
+            # the diff covers just the board, cell k spans column k // 8 and row k % 8 of it
+            names = list(self.board_cells)
+            h, w = diff.shape[0] / 8.0, diff.shape[1] / 8.0
+            for i in range(0, 2):
+                ix, iy = divmod(names.index(sorted_cells[i]), 8)
+                cv2.rectangle(diff, (int(ix * w), int(iy * h)), (int((ix + 1) * w), int((iy + 1) * h)),
+                              (0, 0, 255), 5) # draw square
+            
+            # display diff with player move squares drawn on
+            cv2.imshow('diff', diff)
+            cv2.waitKey(0)  # wait for 0 key to be pressed
+            cv2.destroyAllWindows()  # close image window
 
         return sorted_cells[0], sorted_cells[1]
 
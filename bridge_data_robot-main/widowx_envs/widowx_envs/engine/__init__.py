@@ -0,0 +1,3 @@
+from widowx_envs.engine.position import Position
+from widowx_envs.engine.search import Searcher, SearchResult, search
+from widowx_envs.engine.ponder import Ponderer
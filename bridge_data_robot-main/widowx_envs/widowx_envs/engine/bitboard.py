@@ -0,0 +1,157 @@
+'''
+Bitboard constants and precomputed attack tables.
+
+Squares follow python-chess numbering: a1 = 0, b1 = 1, ..., h8 = 63.
+Bitboards are plain python ints holding 64-bit masks.
+'''
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+WHITE = 0
+BLACK = 1
+
+# piece types, matching python-chess values minus one
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_SYMBOLS = "pnbrqk"
+
+# colored piece index used for the bitboard list: color * 6 + piece type
+NO_PIECE = -1
+
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_2 = RANK_1 << 8
+RANK_7 = RANK_1 << 48
+RANK_8 = RANK_1 << 56
+
+BB_SQUARES = [1 << sq for sq in range(64)]
+
+
+def square_file(sq):
+    return sq & 7
+
+
+def square_rank(sq):
+    return sq >> 3
+
+
+def lsb(bb):
+    '''
+    Index of the least significant set bit
+    '''
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    '''
+    Index of the most significant set bit
+    '''
+    return bb.bit_length() - 1
+
+
+def iter_bits(bb):
+    '''
+    Yield the square index of every set bit, lowest first
+    '''
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def popcount(bb):
+    return bin(bb).count("1")
+
+
+def _step_attacks(deltas):
+    table = []
+    for sq in range(64):
+        f, r = square_file(sq), square_rank(sq)
+        bb = 0
+        for df, dr in deltas:
+            nf, nr = f + df, r + dr
+            if 0 <= nf < 8 and 0 <= nr < 8:
+                bb |= 1 << (nr * 8 + nf)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks([(1, 2), (2, 1), (2, -1), (1, -2),
+                                (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _step_attacks([(1, 0), (1, 1), (0, 1), (-1, 1),
+                              (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# PAWN_ATTACKS[color][sq] = squares attacked by a pawn of that color on sq
+PAWN_ATTACKS = [_step_attacks([(-1, 1), (1, 1)]),
+                _step_attacks([(-1, -1), (1, -1)])]
+
+# ray directions as (file step, rank step); the first four increase the
+# square index, the last four decrease it
+ROOK_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+
+def _ray_table(df, dr):
+    table = []
+    for sq in range(64):
+        f, r = square_file(sq) + df, square_rank(sq) + dr
+        bb = 0
+        while 0 <= f < 8 and 0 <= r < 8:
+            bb |= 1 << (r * 8 + f)
+            f, r = f + df, r + dr
+        table.append(bb)
+    return table
+
+
+# positive rays (blocker found with lsb) and negative rays (blocker with msb)
+RAY_N = _ray_table(0, 1)
+RAY_E = _ray_table(1, 0)
+RAY_NE = _ray_table(1, 1)
+RAY_NW = _ray_table(-1, 1)
+RAY_S = _ray_table(0, -1)
+RAY_W = _ray_table(-1, 0)
+RAY_SE = _ray_table(1, -1)
+RAY_SW = _ray_table(-1, -1)
+
+
+def rook_attacks(sq, occ):
+    '''
+    Rook attacks from sq given the full occupancy
+    '''
+    attacks = 0
+    ray = RAY_N[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_N[lsb(blockers)] if blockers else ray
+    ray = RAY_E[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_E[lsb(blockers)] if blockers else ray
+    ray = RAY_S[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_S[blockers.bit_length() - 1] if blockers else ray
+    ray = RAY_W[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_W[blockers.bit_length() - 1] if blockers else ray
+    return attacks
+
+
+def bishop_attacks(sq, occ):
+    '''
+    Bishop attacks from sq given the full occupancy
+    '''
+    attacks = 0
+    ray = RAY_NE[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_NE[lsb(blockers)] if blockers else ray
+    ray = RAY_NW[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_NW[lsb(blockers)] if blockers else ray
+    ray = RAY_SE[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_SE[blockers.bit_length() - 1] if blockers else ray
+    ray = RAY_SW[sq]
+    blockers = ray & occ
+    attacks |= ray ^ RAY_SW[blockers.bit_length() - 1] if blockers else ray
+    return attacks
+
+
+def queen_attacks(sq, occ):
+    return rook_attacks(sq, occ) | bishop_attacks(sq, occ)
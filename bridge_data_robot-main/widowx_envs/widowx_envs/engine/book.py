@@ -0,0 +1,106 @@
+'''
+Polyglot opening book reader.
+
+A Polyglot .bin file is a sorted array of 16-byte big-endian entries
+(key, move, weight, learn). The file is memory-mapped and entries are found
+by binary search on the Zobrist key, so opening even a large book is
+instant and nothing is loaded up front.
+'''
+
+import mmap
+import random
+import struct
+
+import chess
+import chess.polyglot
+
+ENTRY = struct.Struct(">QHHI")
+
+# Polyglot encodes castling as the king capturing its own rook
+_CASTLING = {
+    (chess.E1, chess.H1): chess.G1,
+    (chess.E1, chess.A1): chess.C1,
+    (chess.E8, chess.H8): chess.G8,
+    (chess.E8, chess.A8): chess.C8,
+}
+
+
+def decode_move(raw, board):
+    '''
+    Turn a Polyglot move word into a python-chess Move on board
+    '''
+    to_sq = raw & 0x3F
+    from_sq = (raw >> 6) & 0x3F
+    promotion = (raw >> 12) & 0x7
+    if board.piece_type_at(from_sq) == chess.KING and (from_sq, to_sq) in _CASTLING:
+        to_sq = _CASTLING[(from_sq, to_sq)]
+    return chess.Move(from_sq, to_sq, promotion=promotion + 1 if promotion else None)
+
+
+class OpeningBook():
+    '''
+    Memory-mapped Polyglot book. Counts hits (positions found in the book)
+    and misses so callers can report how often search was skipped.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self._mmap) // ENTRY.size
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key_at(self, idx):
+        return ENTRY.unpack_from(self._mmap, idx * ENTRY.size)[0]
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries(self, board):
+        '''
+        All (move, weight) pairs stored for board, skipping moves that are
+        not legal (e.g. from a hash collision)
+        '''
+        key = chess.polyglot.zobrist_hash(board)
+        found = []
+        idx = self._lower_bound(key)
+        while idx < self.size:
+            entry_key, raw, weight, _ = ENTRY.unpack_from(self._mmap, idx * ENTRY.size)
+            if entry_key != key:
+                break
+            move = decode_move(raw, board)
+            if board.is_legal(move):
+                found.append((move, weight))
+            idx += 1
+        return found
+
+    def choose(self, board, rng=random):
+        '''
+        Weighted random book move for board, or None when the position is
+        not in the book. Counts a hit or a miss.
+        '''
+        found = [(move, weight) for move, weight in self.entries(board) if weight > 0]
+        if not found:
+            self.misses += 1
+            return None
+        self.hits += 1
+        moves, weights = zip(*found)
+        return rng.choices(moves, weights=weights)[0]
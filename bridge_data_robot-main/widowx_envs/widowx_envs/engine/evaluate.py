@@ -0,0 +1,141 @@
+'''
+Static evaluation: material plus piece-square tables.
+
+The tables are the "simplified evaluation function" values, written as the
+board is seen from white's side (rank 8 on the first row), so a white piece
+on square sq reads index sq ^ 56 and a black piece reads index sq.
+
+Position keeps the sum up to date in make/unmake, so evaluate() is a lookup.
+evaluate_full() recomputes it from the bitboards, and evaluate_batch() scores
+many positions at once as NumPy piece planes dotted with the tables.
+'''
+
+import numpy as np
+
+from widowx_envs.engine.bitboard import WHITE, iter_bits
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+
+PAWN_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0,
+]
+
+KNIGHT_TABLE = [
+    -50,-40,-30,-30,-30,-30,-40,-50,
+    -40,-20,  0,  0,  0,  0,-20,-40,
+    -30,  0, 10, 15, 15, 10,  0,-30,
+    -30,  5, 15, 20, 20, 15,  5,-30,
+    -30,  0, 15, 20, 20, 15,  0,-30,
+    -30,  5, 10, 15, 15, 10,  5,-30,
+    -40,-20,  0,  5,  5,  0,-20,-40,
+    -50,-40,-30,-30,-30,-30,-40,-50,
+]
+
+BISHOP_TABLE = [
+    -20,-10,-10,-10,-10,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5, 10, 10,  5,  0,-10,
+    -10,  5,  5, 10, 10,  5,  5,-10,
+    -10,  0, 10, 10, 10, 10,  0,-10,
+    -10, 10, 10, 10, 10, 10, 10,-10,
+    -10,  5,  0,  0,  0,  0,  5,-10,
+    -20,-10,-10,-10,-10,-10,-10,-20,
+]
+
+ROOK_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0,
+]
+
+QUEEN_TABLE = [
+    -20,-10,-10, -5, -5,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5,  5,  5,  5,  0,-10,
+     -5,  0,  5,  5,  5,  5,  0, -5,
+      0,  0,  5,  5,  5,  5,  0, -5,
+    -10,  5,  5,  5,  5,  5,  0,-10,
+    -10,  0,  5,  0,  0,  0,  0,-10,
+    -20,-10,-10, -5, -5,-10,-10,-20,
+]
+
+KING_TABLE = [
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -20,-30,-30,-40,-40,-30,-30,-20,
+    -10,-20,-20,-20,-20,-20,-20,-10,
+     20, 20,  0,  0,  0,  0, 20, 20,
+     20, 30, 10,  0,  0, 10, 30, 20,
+]
+
+TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+
+# PIECE_SQUARE[piece][sq]: material + table value for each colored piece,
+# always from white's point of view (black entries are negative)
+PIECE_SQUARE = []
+for _color in range(2):
+    for _pt in range(6):
+        if _color == WHITE:
+            PIECE_SQUARE.append([PIECE_VALUES[_pt] + TABLES[_pt][sq ^ 56] for sq in range(64)])
+        else:
+            PIECE_SQUARE.append([-(PIECE_VALUES[_pt] + TABLES[_pt][sq]) for sq in range(64)])
+
+
+# (12, 64) tensor for batched evaluation
+PIECE_SQUARE_ARRAY = np.array(PIECE_SQUARE, dtype=np.int32)
+
+
+def evaluate(pos):
+    '''
+    Score of pos in centipawns from the side to move's point of view
+    '''
+    return pos.score if pos.side == WHITE else -pos.score
+
+
+def evaluate_full(pos):
+    '''
+    Same as evaluate() but summed over the bitboards instead of read from
+    the incremental score
+    '''
+    score = 0
+    pieces = pos.pieces
+    for piece in range(12):
+        table = PIECE_SQUARE[piece]
+        for sq in iter_bits(pieces[piece]):
+            score += table[sq]
+    return score if pos.side == WHITE else -score
+
+
+def piece_planes(positions):
+    '''
+    (N, 12, 64) uint8 array, 1 where piece p of position n is on square sq
+    '''
+    bitboards = np.array([pos.pieces for pos in positions], dtype=np.uint64).reshape(-1, 12)
+    # little-endian bytes of each bitboard unpacked lsb first give squares 0..63
+    planes = np.unpackbits(bitboards.astype('<u8').view(np.uint8), axis=1, bitorder='little')
+    return planes.reshape(-1, 12, 64)
+
+
+def evaluate_batch(positions):
+    '''
+    Scores of many positions (each from its side to move's point of view) as
+    an int array, e.g. for all leaves below a node at once
+    '''
+    planes = piece_planes(positions)
+    scores = np.tensordot(planes, PIECE_SQUARE_ARRAY, axes=([1, 2], [0, 1]))
+    sides = np.array([pos.side for pos in positions], dtype=np.int32)
+    return np.where(sides == WHITE, scores, -scores)
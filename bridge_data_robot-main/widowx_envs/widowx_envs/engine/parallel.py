@@ -0,0 +1,173 @@
+'''
+Root-split parallel search over a process pool.
+
+Each iteration of the deepening loop searches the previous best root move
+first to establish a bound, then hands the remaining root moves to the pool
+one task per move. All workers share one transposition table in shared
+memory, so a move searched by one worker at depth d helps whichever worker
+gets it at depth d + 1.
+'''
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from widowx_envs.engine.position import Position
+from widowx_envs.engine.search import (
+    Searcher, SearchResult, SearchTimeout, INFINITY, MATE_SCORE, MAX_DEPTH, DEFAULT_DEPTH,
+)
+from widowx_envs.engine.tablebase import Tablebase
+from widowx_envs.engine.tt import TranspositionTable, EXACT
+
+# per-process searcher, created once by the pool initializer
+_worker_searcher = None
+
+
+def _init_worker(tt, tablebase_dir):
+    global _worker_searcher
+    # tablebase files are mapped per process, the OS shares the pages
+    tablebase = Tablebase(tablebase_dir) if tablebase_dir else None
+    _worker_searcher = Searcher(tt=tt, tablebase=tablebase)
+
+
+def _search_root_move(root_fen, history, move, depth, alpha, age, deadline):
+    '''
+    Pool task: score one root move. Returns (move, score, pv, nodes), with
+    score None if the deadline passed first.
+    '''
+    pos = Position(root_fen)
+    for m in history:
+        pos.make(m)
+    _worker_searcher.tt.age = age
+    try:
+        score, pv = _worker_searcher.search_move(pos, move, depth, alpha, INFINITY, deadline)
+    except SearchTimeout:
+        return move, None, [], _worker_searcher.nodes
+    return move, score, pv, _worker_searcher.nodes
+
+
+class ParallelSearcher():
+    '''
+    Iterative-deepening search that splits root moves across worker
+    processes. Create it once per game and call close() when done.
+
+    `searcher` is an in-process Searcher on the same shared table, e.g. for
+    pondering between moves. With tablebase_dir every process opens the
+    Syzygy tables there and probes them at search leaves.
+    '''
+
+    def __init__(self, workers=None, tt_size_mb=32, tablebase_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tt = TranspositionTable(tt_size_mb, shared=True)
+        self.tablebase = Tablebase(tablebase_dir) if tablebase_dir else None
+        self.searcher = Searcher(tt=self.tt, tablebase=self.tablebase)
+        self.nodes = 0
+        self.iterations = []
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self.tt, tablebase_dir))
+        self._pending = set()  # root move searches of the current iteration
+
+    def close(self):
+        # shutdown(cancel_futures=True) needs Python 3.9
+        for future in self._pending:
+            future.cancel()
+        self._pool.shutdown(wait=True)
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, pos, depth=None, think_ms=None):
+        '''
+        Same contract as Searcher.search: iterative deepening up to depth,
+        bounded by think_ms if given, returning the last finished iteration
+        '''
+        start = time.monotonic()
+        deadline = start + think_ms / 1000.0 if think_ms is not None else None
+        if depth is None:
+            depth = MAX_DEPTH if deadline is not None else DEFAULT_DEPTH
+        depth = min(depth, MAX_DEPTH)
+
+        self.nodes = 0
+        self.iterations = []
+        self.tt.new_search()
+
+        # replay recipe for workers: the root fen and the moves played since
+        root_fen, history = pos.history()
+
+        moves = pos.legal_moves()
+        if not moves:
+            score = -MATE_SCORE if pos.in_check() else 0
+            return SearchResult(0, score, 0, 0, time.monotonic() - start, [])
+        first = self.tt.best_move(pos.hash)
+        if first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+
+        result = None
+        for d in range(1, depth + 1):
+            scored = self._iteration(root_fen, history, moves, d, deadline)
+            if scored is None:
+                break
+            # best first; the next iteration searches in this order
+            scored.sort(key=lambda item: -item[1])
+            moves = [m for m, _, _ in scored]
+            best_move, best_score, pv = scored[0]
+            self.tt.store(pos.hash, d, EXACT, best_score, best_move)
+            result = SearchResult(best_move, best_score, d, self.nodes, time.monotonic() - start, pv)
+            self.iterations.append(result)
+            if abs(best_score) >= MATE_SCORE - MAX_DEPTH:
+                break
+
+        if result is None:
+            result = SearchResult(moves[0], 0, 0, self.nodes, time.monotonic() - start, [moves[0]])
+        return result
+
+    def _iteration(self, root_fen, history, moves, depth, deadline):
+        '''
+        Search every root move to depth. Returns [(move, score, pv)] or None
+        if the deadline passed before all moves were searched.
+        '''
+        age = self.tt.age
+        submit = self._pool.submit
+
+        # the first move sets the bound the others are searched against
+        move, score, pv, nodes = submit(_search_root_move, root_fen, history, moves[0], depth,
+                                        -INFINITY, age, deadline).result()
+        self.nodes += nodes
+        if score is None:
+            return None
+        alpha = score
+        scored = [(move, score, pv)]
+
+        self._pending = pending = {submit(_search_root_move, root_fen, history, m, depth, alpha, age, deadline)
+                                   for m in moves[1:]}
+        timed_out = False
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            self._pending = pending
+            for future in done:
+                move, score, pv, nodes = future.result()
+                self.nodes += nodes
+                if score is None:
+                    timed_out = True
+                else:
+                    scored.append((move, score, pv))
+        if timed_out:
+            return None
+        return scored
+
+
+def parallel_search(board, parallel_searcher, depth=None, think_ms=None):
+    '''
+    Counterpart of engine.search() for a ParallelSearcher: takes a
+    python-chess Board and returns a SearchResult with python-chess Moves
+    '''
+    pos = Position.from_board(board)
+    result = parallel_searcher.search(pos, depth=depth, think_ms=think_ms)
+    move = pos.to_chess_move(result.move) if result.move else None
+    return result._replace(move=move, pv=[pos.to_chess_move(m) for m in result.pv])
@@ -0,0 +1,120 @@
+'''
+Pondering: search the opponent's possible replies while waiting for them.
+'''
+
+import threading
+
+from widowx_envs.engine.search import search
+
+
+class Ponderer():
+    '''
+    Background thread that searches the engine's answer to the opponent's
+    replies while the opponent is thinking.
+
+    The expected reply (the second move of the last principal variation) is
+    searched first with the real search settings. Every other legal reply is
+    then searched shallowly to warm the transposition table and rank them,
+    and the replies are given full searches from the opponent's best one down
+    until stop() is called. Full results are cached by reply, so when the
+    detected move was pondered the engine's answer is available at once.
+
+    The Searcher is shared with the main search, so even a ponder miss
+    leaves useful entries in its transposition table. Call stop() before
+    using the Searcher from another thread.
+    '''
+
+    def __init__(self, searcher, depth=None, think_ms=None, shallow_depth=2):
+        self.searcher = searcher
+        self.depth = depth
+        self.think_ms = think_ms
+        self.shallow_depth = shallow_depth
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        self._pondering = False  # whether start() ran since the last lookup
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, board, expected=None):
+        '''
+        Start pondering on board, the position with the opponent to move
+        '''
+        self.stop()
+        self._results = {}
+        self._pondering = True
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._ponder, args=(board.copy(), expected), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop pondering and wait for the thread to exit
+        '''
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def result_for(self, move):
+        '''
+        Cached SearchResult for the opponent playing move, or None.
+        Counts a ponder hit or miss unless nothing was pondered.
+        '''
+        if not self._pondering:
+            return None
+        self._pondering = False
+        result = self._results.get(move)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def pondered_moves(self):
+        return list(self._results)
+
+    def _search(self, board, reply, depth, think_ms):
+        board.push(reply)
+        try:
+            result = search(board, depth=depth, think_ms=think_ms,
+                            searcher=self.searcher, stop_event=self._stop_event)
+        finally:
+            board.pop()
+        return None if self.searcher.stopped else result
+
+    def _ponder(self, board, expected):
+        replies = list(board.legal_moves)
+        if expected not in replies:
+            expected = None
+
+        if expected is not None:
+            result = self._search(board, expected, self.depth, self.think_ms)
+            if result is None:
+                return
+            self._results[expected] = result
+
+        # shallow pass over the rest; the engine's score is lowest after the
+        # opponent's strongest replies, which are the likeliest ones
+        scored = []
+        for reply in replies:
+            if reply == expected:
+                continue
+            result = self._search(board, reply, self.shallow_depth, None)
+            if result is None:
+                return
+            scored.append((result.score, reply))
+        scored.sort(key=lambda item: item[0])
+
+        for _, reply in scored:
+            result = self._search(board, reply, self.depth, self.think_ms)
+            if result is None:
+                return
+            self._results[reply] = result
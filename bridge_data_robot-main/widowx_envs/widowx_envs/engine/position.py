@@ -0,0 +1,442 @@
+'''
+Bitboard position with in-place make/unmake and pseudo-legal move generation.
+
+Moves are encoded as plain ints so that the search never allocates move
+objects:
+
+    bits 0-5    from square
+    bits 6-11   to square
+    bits 12-14  promotion piece type (0 for none, KNIGHT..QUEEN otherwise)
+    bits 15-16  flag (NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLE)
+'''
+
+import chess
+
+from widowx_envs.engine.bitboard import (
+    WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, NO_PIECE,
+    PIECE_SYMBOLS, BB_SQUARES, RANK_1, RANK_8, FILE_A, FILE_H,
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS,
+    rook_attacks, bishop_attacks, iter_bits, lsb,
+)
+from widowx_envs.engine.evaluate import PIECE_SQUARE
+from widowx_envs.engine.zobrist import (
+    PIECE_KEYS, CASTLING_KEYS, WHITE_TO_MOVE_KEY, ep_key, compute_hash,
+)
+
+NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLE = range(4)
+
+NULL_MOVE = 0
+
+# castling rights bits
+WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO = 1, 2, 4, 8
+
+# rights that survive a move touching each square
+CASTLE_MASK = [15] * 64
+CASTLE_MASK[chess.E1] = 15 & ~(WHITE_OO | WHITE_OOO)
+CASTLE_MASK[chess.H1] = 15 & ~WHITE_OO
+CASTLE_MASK[chess.A1] = 15 & ~WHITE_OOO
+CASTLE_MASK[chess.E8] = 15 & ~(BLACK_OO | BLACK_OOO)
+CASTLE_MASK[chess.H8] = 15 & ~BLACK_OO
+CASTLE_MASK[chess.A8] = 15 & ~BLACK_OOO
+
+# rook from/to squares indexed by king destination
+CASTLE_ROOK = {
+    chess.G1: (chess.H1, chess.F1),
+    chess.C1: (chess.A1, chess.D1),
+    chess.G8: (chess.H8, chess.F8),
+    chess.C8: (chess.A8, chess.D8),
+}
+
+STARTING_FEN = chess.STARTING_FEN
+
+
+def encode_move(from_sq, to_sq, promotion=0, flag=NORMAL):
+    return from_sq | (to_sq << 6) | (promotion << 12) | (flag << 15)
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_promotion(move):
+    return (move >> 12) & 7
+
+
+def move_flag(move):
+    return move >> 15
+
+
+class Position():
+    '''
+    Chess position stored as twelve piece bitboards plus a square mailbox,
+    with a Zobrist hash and the material + piece-square score (from white's
+    view, see evaluate.PIECE_SQUARE) kept up to date by make/unmake
+    '''
+
+    __slots__ = ("pieces", "occupied", "board", "side", "castling", "ep",
+                 "halfmove", "fullmove", "hash", "score", "_stack")
+
+    def __init__(self, fen=STARTING_FEN):
+        self.set_fen(fen)
+
+    @classmethod
+    def from_board(cls, board):
+        '''
+        Build a position from a python-chess Board, replaying its move stack
+        so that repetitions of earlier game positions are detected
+        '''
+        pos = cls(board.root().fen())
+        for move in board.move_stack:
+            pos.make(pos.from_chess_move(move))
+        return pos
+
+    def set_fen(self, fen):
+        parts = fen.split()
+        self.pieces = [0] * 12
+        self.occupied = [0, 0]
+        self.board = [NO_PIECE] * 64
+        self.hash = 0
+        self.score = 0
+        self._stack = []
+
+        rank, file = 7, 0
+        for c in parts[0]:
+            if c == "/":
+                rank, file = rank - 1, 0
+            elif c.isdigit():
+                file += int(c)
+            else:
+                color = WHITE if c.isupper() else BLACK
+                self._put(color * 6 + PIECE_SYMBOLS.index(c.lower()), rank * 8 + file)
+                file += 1
+
+        self.side = WHITE if parts[1] == "w" else BLACK
+        self.castling = 0
+        for c, bit in (("K", WHITE_OO), ("Q", WHITE_OOO), ("k", BLACK_OO), ("q", BLACK_OOO)):
+            if c in parts[2]:
+                self.castling |= bit
+        self.ep = chess.parse_square(parts[3]) if parts[3] != "-" else -1
+        self.halfmove = int(parts[4]) if len(parts) > 4 else 0
+        self.fullmove = int(parts[5]) if len(parts) > 5 else 1
+        self.hash = compute_hash(self)
+
+    def fen(self):
+        rows = []
+        for rank in range(7, -1, -1):
+            row, empty = "", 0
+            for file in range(8):
+                piece = self.board[rank * 8 + file]
+                if piece == NO_PIECE:
+                    empty += 1
+                    continue
+                if empty:
+                    row, empty = row + str(empty), 0
+                symbol = PIECE_SYMBOLS[piece % 6]
+                row += symbol.upper() if piece < 6 else symbol
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(c for c, bit in (("K", WHITE_OO), ("Q", WHITE_OOO), ("k", BLACK_OO), ("q", BLACK_OOO))
+                           if self.castling & bit) or "-"
+        ep = chess.square_name(self.ep) if self.ep >= 0 else "-"
+        return "{} {} {} {} {} {}".format("/".join(rows), "wb"[self.side], castling, ep,
+                                          self.halfmove, self.fullmove)
+
+    ##########################################################################
+    # piece placement
+
+    def _put(self, piece, sq):
+        bit = BB_SQUARES[sq]
+        self.pieces[piece] |= bit
+        self.occupied[piece // 6] |= bit
+        self.board[sq] = piece
+        self.hash ^= PIECE_KEYS[piece][sq]
+        self.score += PIECE_SQUARE[piece][sq]
+
+    def _remove(self, piece, sq):
+        bit = BB_SQUARES[sq]
+        self.pieces[piece] ^= bit
+        self.occupied[piece // 6] ^= bit
+        self.board[sq] = NO_PIECE
+        self.hash ^= PIECE_KEYS[piece][sq]
+        self.score -= PIECE_SQUARE[piece][sq]
+
+    ##########################################################################
+    # make / unmake
+
+    def make(self, move):
+        '''
+        Play move in place, pushing the information needed to undo it
+        '''
+        board = self.board
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 15
+        us = self.side
+        piece = board[from_sq]
+        captured = board[to_sq]
+
+        self._stack.append((move, captured, self.castling, self.ep, self.halfmove, self.hash))
+
+        self.hash ^= ep_key(self) ^ CASTLING_KEYS[self.castling] ^ WHITE_TO_MOVE_KEY
+        self.halfmove += 1
+        if captured != NO_PIECE:
+            self._remove(captured, to_sq)
+            self.halfmove = 0
+        self._remove(piece, from_sq)
+
+        promotion = (move >> 12) & 7
+        if promotion:
+            self._put(us * 6 + promotion, to_sq)
+        else:
+            self._put(piece, to_sq)
+
+        self.ep = -1
+        if piece % 6 == PAWN:
+            self.halfmove = 0
+            if flag == DOUBLE_PUSH:
+                self.ep = (from_sq + to_sq) >> 1
+            elif flag == EN_PASSANT:
+                cap_sq = to_sq - 8 if us == WHITE else to_sq + 8
+                self._remove(board[cap_sq], cap_sq)
+        elif flag == CASTLE:
+            rook_from, rook_to = CASTLE_ROOK[to_sq]
+            self._remove(us * 6 + ROOK, rook_from)
+            self._put(us * 6 + ROOK, rook_to)
+
+        self.castling &= CASTLE_MASK[from_sq] & CASTLE_MASK[to_sq]
+        if us == BLACK:
+            self.fullmove += 1
+        self.side = us ^ 1
+        self.hash ^= CASTLING_KEYS[self.castling] ^ ep_key(self)
+
+    def unmake(self):
+        '''
+        Undo the last move played with make
+        '''
+        move, captured, self.castling, self.ep, self.halfmove, h = self._stack.pop()
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 15
+        self.side ^= 1
+        us = self.side
+        if us == BLACK:
+            self.fullmove -= 1
+
+        piece = self.board[to_sq]
+        self._remove(piece, to_sq)
+        if (move >> 12) & 7:
+            piece = us * 6 + PAWN
+        self._put(piece, from_sq)
+
+        if captured != NO_PIECE:
+            self._put(captured, to_sq)
+        elif flag == EN_PASSANT:
+            cap_sq = to_sq - 8 if us == WHITE else to_sq + 8
+            self._put((us ^ 1) * 6 + PAWN, cap_sq)
+        elif flag == CASTLE:
+            rook_from, rook_to = CASTLE_ROOK[to_sq]
+            self._remove(us * 6 + ROOK, rook_to)
+            self._put(us * 6 + ROOK, rook_from)
+        self.hash = h
+
+    def make_null(self):
+        self._stack.append((NULL_MOVE, NO_PIECE, self.castling, self.ep, self.halfmove, self.hash))
+        self.hash ^= ep_key(self) ^ WHITE_TO_MOVE_KEY
+        self.ep = -1
+        self.side ^= 1
+
+    def unmake_null(self):
+        _, _, self.castling, self.ep, self.halfmove, self.hash = self._stack.pop()
+        self.side ^= 1
+
+    def history(self):
+        '''
+        The fen this position started from and the moves played since
+        '''
+        moves = [entry[0] for entry in self._stack]
+        for _ in moves:
+            self.unmake()
+        root_fen = self.fen()
+        for move in moves:
+            self.make(move)
+        return root_fen, moves
+
+    def is_repetition(self):
+        '''
+        Whether the current position already occurred since the last
+        irreversible move (within the moves played on this Position)
+        '''
+        stack = self._stack
+        h = self.hash
+        # only positions with the same side to move, back to the last capture or pawn move
+        for i in range(len(stack) - 2, max(len(stack) - self.halfmove, 0) - 1, -2):
+            if stack[i][5] == h:
+                return True
+        return False
+
+    ##########################################################################
+    # attacks
+
+    def is_attacked(self, sq, by):
+        '''
+        Whether side `by` attacks square sq
+        '''
+        pieces = self.pieces
+        base = by * 6
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]:
+            return True
+        if PAWN_ATTACKS[by ^ 1][sq] & pieces[base + PAWN]:
+            return True
+        if KING_ATTACKS[sq] & pieces[base + KING]:
+            return True
+        occ = self.occupied[0] | self.occupied[1]
+        rooks = pieces[base + ROOK] | pieces[base + QUEEN]
+        if rooks and rook_attacks(sq, occ) & rooks:
+            return True
+        bishops = pieces[base + BISHOP] | pieces[base + QUEEN]
+        if bishops and bishop_attacks(sq, occ) & bishops:
+            return True
+        return False
+
+    def king_square(self, color):
+        return lsb(self.pieces[color * 6 + KING])
+
+    def in_check(self, color=None):
+        if color is None:
+            color = self.side
+        return self.is_attacked(lsb(self.pieces[color * 6 + KING]), color ^ 1)
+
+    def was_legal(self):
+        '''
+        After make, whether the side that just moved left its king safe
+        '''
+        mover = self.side ^ 1
+        return not self.is_attacked(lsb(self.pieces[mover * 6 + KING]), self.side)
+
+    ##########################################################################
+    # move generation
+
+    def generate_moves(self, captures_only=False):
+        '''
+        Pseudo-legal moves for the side to move. With captures_only, only
+        captures and promotions are generated (for quiescence search).
+        '''
+        moves = []
+        append = moves.append
+        us = self.side
+        them = us ^ 1
+        pieces = self.pieces
+        own = self.occupied[us]
+        enemy = self.occupied[them]
+        occ = own | enemy
+        empty = ~occ & 0xFFFFFFFFFFFFFFFF
+        targets = enemy if captures_only else ~own & 0xFFFFFFFFFFFFFFFF
+        base = us * 6
+
+        # pawns
+        pawns = pieces[base + PAWN]
+        if us == WHITE:
+            push = (pawns << 8) & empty
+            double = ((push & (RANK_1 << 16)) << 8) & empty
+            left = ((pawns & ~FILE_A) << 7) & enemy
+            right = ((pawns & ~FILE_H) << 9) & enemy
+            promo_rank, step = RANK_8, 8
+        else:
+            push = (pawns >> 8) & empty
+            double = ((push & (RANK_8 >> 16)) >> 8) & empty
+            left = ((pawns & ~FILE_A) >> 9) & enemy
+            right = ((pawns & ~FILE_H) >> 7) & enemy
+            promo_rank, step = RANK_1, -8
+
+        for to_sq in iter_bits(push & promo_rank):
+            for promo in (QUEEN, KNIGHT, ROOK, BISHOP):
+                append((to_sq - step) | (to_sq << 6) | (promo << 12))
+        for to_sq in iter_bits(left & promo_rank):
+            for promo in (QUEEN, KNIGHT, ROOK, BISHOP):
+                append((to_sq - step + 1) | (to_sq << 6) | (promo << 12))
+        for to_sq in iter_bits(right & promo_rank):
+            for promo in (QUEEN, KNIGHT, ROOK, BISHOP):
+                append((to_sq - step - 1) | (to_sq << 6) | (promo << 12))
+        for to_sq in iter_bits(left & ~promo_rank):
+            append((to_sq - step + 1) | (to_sq << 6))
+        for to_sq in iter_bits(right & ~promo_rank):
+            append((to_sq - step - 1) | (to_sq << 6))
+        if self.ep >= 0:
+            for from_sq in iter_bits(PAWN_ATTACKS[them][self.ep] & pawns):
+                append(from_sq | (self.ep << 6) | (EN_PASSANT << 15))
+        if not captures_only:
+            for to_sq in iter_bits(push & ~promo_rank):
+                append((to_sq - step) | (to_sq << 6))
+            for to_sq in iter_bits(double):
+                append((to_sq - 2 * step) | (to_sq << 6) | (DOUBLE_PUSH << 15))
+
+        # pieces
+        for from_sq in iter_bits(pieces[base + KNIGHT]):
+            for to_sq in iter_bits(KNIGHT_ATTACKS[from_sq] & targets):
+                append(from_sq | (to_sq << 6))
+        for from_sq in iter_bits(pieces[base + BISHOP] | pieces[base + QUEEN]):
+            for to_sq in iter_bits(bishop_attacks(from_sq, occ) & targets):
+                append(from_sq | (to_sq << 6))
+        for from_sq in iter_bits(pieces[base + ROOK] | pieces[base + QUEEN]):
+            for to_sq in iter_bits(rook_attacks(from_sq, occ) & targets):
+                append(from_sq | (to_sq << 6))
+        king_sq = lsb(pieces[base + KING])
+        for to_sq in iter_bits(KING_ATTACKS[king_sq] & targets):
+            append(king_sq | (to_sq << 6))
+
+        # castling; the destination square is checked by the legality test
+        if not captures_only and self.castling:
+            if us == WHITE:
+                if (self.castling & WHITE_OO and not occ & 0x60
+                        and not self.is_attacked(chess.E1, them) and not self.is_attacked(chess.F1, them)):
+                    append(chess.E1 | (chess.G1 << 6) | (CASTLE << 15))
+                if (self.castling & WHITE_OOO and not occ & 0x0E
+                        and not self.is_attacked(chess.E1, them) and not self.is_attacked(chess.D1, them)):
+                    append(chess.E1 | (chess.C1 << 6) | (CASTLE << 15))
+            else:
+                if (self.castling & BLACK_OO and not occ & (0x60 << 56)
+                        and not self.is_attacked(chess.E8, them) and not self.is_attacked(chess.F8, them)):
+                    append(chess.E8 | (chess.G8 << 6) | (CASTLE << 15))
+                if (self.castling & BLACK_OOO and not occ & (0x0E << 56)
+                        and not self.is_attacked(chess.E8, them) and not self.is_attacked(chess.D8, them)):
+                    append(chess.E8 | (chess.C8 << 6) | (CASTLE << 15))
+        return moves
+
+    def legal_moves(self):
+        legal = []
+        for move in self.generate_moves():
+            self.make(move)
+            if self.was_legal():
+                legal.append(move)
+            self.unmake()
+        return legal
+
+    def is_capture(self, move):
+        return self.board[(move >> 6) & 63] != NO_PIECE or move >> 15 == EN_PASSANT
+
+    ##########################################################################
+    # python-chess interop
+
+    def to_chess_move(self, move):
+        promotion = (move >> 12) & 7
+        return chess.Move(move & 63, (move >> 6) & 63, promotion=promotion + 1 if promotion else None)
+
+    def from_chess_move(self, chess_move):
+        '''
+        Encode a python-chess Move for this position
+        '''
+        from_sq, to_sq = chess_move.from_square, chess_move.to_square
+        promotion = chess_move.promotion - 1 if chess_move.promotion else 0
+        piece = self.board[from_sq] % 6
+        flag = NORMAL
+        if piece == PAWN:
+            if abs(to_sq - from_sq) == 16:
+                flag = DOUBLE_PUSH
+            elif to_sq == self.ep:
+                flag = EN_PASSANT
+        elif piece == KING and abs(to_sq - from_sq) == 2:
+            flag = CASTLE
+        return encode_move(from_sq, to_sq, promotion, flag)
@@ -0,0 +1,422 @@
+'''
+Negamax alpha-beta search over the bitboard Position, backed by a
+transposition table that persists between searches.
+
+Searches either run to a fixed depth or, given a think time, deepen one ply
+at a time and return the best move of the last finished iteration. Leaves
+are resolved by a captures-only quiescence search.
+
+Move ordering: hash (or PV) move, captures by MVV-LVA (most valuable victim,
+least valuable attacker) and queen promotions, the two killer moves of the
+ply, then quiet moves by history score.
+'''
+
+import time
+from collections import namedtuple
+
+from widowx_envs.engine.bitboard import PAWN, QUEEN, NO_PIECE
+from widowx_envs.engine.evaluate import evaluate, PIECE_VALUES
+from widowx_envs.engine.tablebase import WDL_SCORES
+from widowx_envs.engine.position import Position, EN_PASSANT
+from widowx_envs.engine.tt import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_DEPTH = 64
+MAX_PLY = 128  # nominal depth plus quiescence
+DEFAULT_DEPTH = 5
+
+# move ordering scores; history scores stay below KILLER_SCORE
+HASH_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 24
+KILLER_SCORE = 1 << 22
+HISTORY_MAX = 1 << 20
+
+# quiescence skips captures that leave the score this far below alpha
+DELTA_MARGIN = 200
+
+# MVV_LVA[victim][attacker], by piece type
+MVV_LVA = [[victim * 8 + 5 - attacker for attacker in range(6)] for victim in range(6)]
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "elapsed", "pv"])
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Searcher():
+    '''
+    Alpha-beta searcher. Scores are in centipawns from the side to move's
+    point of view; mate scores are MATE_SCORE minus the distance in plies.
+
+    Keep one Searcher per game so its transposition table carries the work
+    of previous moves over to the next search. An existing (e.g. shared)
+    TranspositionTable can be passed in as tt.
+
+    With a Tablebase, positions inside it are scored by WDL probes instead
+    of being searched, right after captures and pawn moves (where the
+    50-move counter is zero and WDL is exact).
+    '''
+
+    def __init__(self, tt_size_mb=32, tt=None, tablebase=None):
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        self.tablebase = tablebase
+        self.nodes = 0
+        self.qnodes = 0  # of nodes, those in quiescence search
+        self.cutoffs = 0  # beta cutoffs
+        self.first_move_cutoffs = 0  # beta cutoffs on the first move searched
+        self.iterations = []  # SearchResult of every finished iteration of the last search
+        self._deadline = None
+        self._stop_event = None
+        self.stopped = False  # whether the last search was cut short by its stop event
+        self._pv = []  # principal variation of the previous iteration
+        self._pv_table = [[] for _ in range(MAX_PLY + 1)]
+        self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self._history = [[0] * 64 for _ in range(12)]  # [piece][to square]
+
+    @property
+    def first_move_cutoff_rate(self):
+        '''
+        Share of beta cutoffs produced by the first move, a measure of how
+        good the move ordering is
+        '''
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def _reset(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        # keep some history from the previous search
+        self._history = [[h >> 2 for h in row] for row in self._history]
+
+    def search(self, pos, depth=None, think_ms=None, stop_event=None):
+        '''
+        Search pos with iterative deepening.
+
+        Without think_ms every iteration up to depth (DEFAULT_DEPTH if None)
+        is completed. With think_ms, deepening continues up to depth (or
+        MAX_DEPTH) until the wall-clock budget is spent; an unfinished
+        iteration is abandoned and the last finished one is returned.
+        Setting stop_event (a threading.Event) aborts the search the same way.
+
+        Returns a SearchResult whose move is an encoded int (0 if there are
+        no legal moves) and whose pv is a list of encoded moves.
+        '''
+        start = time.monotonic()
+        budget = think_ms / 1000.0 if think_ms is not None else None
+        if depth is None:
+            depth = MAX_DEPTH if budget is not None else DEFAULT_DEPTH
+        depth = min(depth, MAX_DEPTH)
+
+        self._reset()
+        self.iterations = []
+        self.tt.new_search()
+        self._pv = []
+        self._deadline = start + budget if budget is not None else None
+        self._stop_event = stop_event
+        self.stopped = False
+
+        result = None
+        last_iteration_time = 0.0
+        for d in range(1, depth + 1):
+            iteration_start = time.monotonic()
+            try:
+                score, move = self._root(pos, d)
+            except SearchTimeout:
+                break
+            now = time.monotonic()
+            self._pv = list(self._pv_table[0])
+            result = SearchResult(move, score, d, self.nodes, now - start, self._pv)
+            self.iterations.append(result)
+            if not move or abs(score) >= MATE_SCORE - MAX_DEPTH:
+                break
+            if budget is not None:
+                # skip an iteration that would almost certainly not finish
+                iteration_time = now - iteration_start
+                growth = iteration_time / last_iteration_time if last_iteration_time > 0 else 4.0
+                last_iteration_time = iteration_time
+                if now - start + iteration_time * min(max(growth, 2.0), 8.0) > budget:
+                    break
+
+        if result is None:
+            # not even depth one finished, fall back to the first legal move
+            legal = pos.legal_moves()
+            move = legal[0] if legal else 0
+            result = SearchResult(move, 0, 0, self.nodes, time.monotonic() - start, [move] if move else [])
+        return result
+
+    def search_move(self, pos, move, depth, alpha=-INFINITY, beta=INFINITY, deadline=None):
+        '''
+        Score of playing move in pos, searched to depth with the window
+        (alpha, beta). Used to split the root between processes.
+
+        Returns (score, pv); raises SearchTimeout once time.monotonic()
+        passes deadline.
+        '''
+        self.nodes = 0
+        self.qnodes = 0
+        self._deadline = deadline
+        self._stop_event = None
+        self._pv = []
+        pos.make(move)
+        try:
+            score = -self._negamax(pos, depth - 1, -beta, -alpha, 1)
+        finally:
+            pos.unmake()
+        return score, [move] + self._pv_table[1]
+
+    def _check_time(self):
+        if self._stop_event is not None and self._stop_event.is_set():
+            self.stopped = True
+            raise SearchTimeout()
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise SearchTimeout()
+
+    def _order(self, pos, moves, hash_move=0, ply=0):
+        '''
+        Sort moves best first for the search (see the module docstring)
+        '''
+        board = pos.board
+        killer1, killer2 = self._killers[ply]
+        history = self._history
+        scored = []
+        for m in moves:
+            to_sq = (m >> 6) & 63
+            victim = board[to_sq]
+            if m == hash_move:
+                score = HASH_SCORE
+            elif victim != NO_PIECE:
+                score = CAPTURE_SCORE + MVV_LVA[victim % 6][board[m & 63] % 6]
+            elif m >> 15 == EN_PASSANT:
+                score = CAPTURE_SCORE + MVV_LVA[PAWN][PAWN]
+            elif (m >> 12) & 7 == QUEEN:
+                score = CAPTURE_SCORE + MVV_LVA[QUEEN][PAWN]
+            elif m == killer1:
+                score = KILLER_SCORE + 1
+            elif m == killer2:
+                score = KILLER_SCORE
+            else:
+                score = history[board[m & 63]][to_sq]
+            scored.append((score, m))
+        scored.sort(reverse=True)
+        return [m for _, m in scored]
+
+    def _order_captures(self, pos, moves):
+        board = pos.board
+        scored = []
+        for m in moves:
+            victim = board[(m >> 6) & 63]
+            if victim != NO_PIECE:
+                score = MVV_LVA[victim % 6][board[m & 63] % 6]
+            else:
+                score = MVV_LVA[PAWN][PAWN]  # en passant or a promotion push
+            scored.append((score, m))
+        scored.sort(reverse=True)
+        return [m for _, m in scored]
+
+    def _update_quiet(self, piece, move, depth, ply):
+        '''
+        Remember a quiet move of piece that caused a beta cutoff
+        '''
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        to_sq = (move >> 6) & 63
+        row = self._history[piece]
+        row[to_sq] += depth * depth
+        if row[to_sq] > HISTORY_MAX:
+            self._history = [[h >> 1 for h in r] for r in self._history]
+
+    def _root(self, pos, depth):
+        alpha, beta = -INFINITY, INFINITY
+        best_move, best_score = 0, -INFINITY
+        self._pv_table[0] = []
+        # the previous iteration's best move goes first, then the stored hash move
+        first = self._pv[0] if self._pv else self.tt.best_move(pos.hash)
+        for move in self._order(pos, pos.generate_moves(), first, 0):
+            pos.make(move)
+            if not pos.was_legal():
+                pos.unmake()
+                continue
+            score = -self._negamax(pos, depth - 1, -beta, -alpha, 1, bool(self._pv) and move == first)
+            pos.unmake()
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                self._pv_table[0] = [move] + self._pv_table[1]
+        if best_move == 0:
+            best_score = -MATE_SCORE if pos.in_check() else 0
+        else:
+            self.tt.store(pos.hash, depth, EXACT, best_score, best_move)
+        return best_score, best_move
+
+    def _negamax(self, pos, depth, alpha, beta, ply, on_pv=False):
+        '''
+        on_pv is true while the search follows the previous iteration's
+        principal variation, whose move is then tried first at this ply
+        '''
+        self.nodes += 1
+        if not self.nodes & 2047:
+            self._check_time()
+        self._pv_table[ply] = []
+
+        if pos.halfmove >= 100 or pos.is_repetition():
+            return 0
+        if self.tablebase is not None and pos.halfmove == 0:
+            wdl = self.tablebase.probe_position(pos)
+            if wdl is not None:
+                # nearer wins score higher, like mates
+                if wdl == 2:
+                    return WDL_SCORES[wdl] - ply
+                if wdl == -2:
+                    return WDL_SCORES[wdl] + ply
+                return WDL_SCORES[wdl]
+        if depth <= 0:
+            self.nodes -= 1  # counted again by quiescence
+            return self._quiesce(pos, alpha, beta, ply)
+
+        alpha_orig = alpha
+        hash_move = 0
+        entry = self.tt.probe(pos.hash)
+        if entry is not None:
+            tt_depth, bound, tt_score, hash_move = entry
+            if tt_depth >= depth and not on_pv:
+                tt_score = score_from_tt(tt_score, ply)
+                if bound == EXACT:
+                    return tt_score
+                if bound == LOWER and tt_score >= beta:
+                    return tt_score
+                if bound == UPPER and tt_score <= alpha:
+                    return tt_score
+        if on_pv and ply < len(self._pv):
+            hash_move = self._pv[ply]
+        else:
+            on_pv = False
+
+        best_score, best_move = -INFINITY, 0
+        searched = 0
+        board = pos.board
+        for move in self._order(pos, pos.generate_moves(), hash_move, ply):
+            quiet = board[(move >> 6) & 63] == NO_PIECE and not (move >> 12) & 7 and move >> 15 != EN_PASSANT
+            piece = board[move & 63]
+            pos.make(move)
+            if not pos.was_legal():
+                pos.unmake()
+                continue
+            score = -self._negamax(pos, depth - 1, -beta, -alpha, ply + 1, on_pv and move == hash_move)
+            pos.unmake()
+            searched += 1
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    self._pv_table[ply] = [move] + self._pv_table[ply + 1]
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if searched == 1:
+                            self.first_move_cutoffs += 1
+                        if quiet:
+                            self._update_quiet(piece, move, depth, ply)
+                        break
+
+        if best_score == -INFINITY:
+            # no legal moves: checkmate or stalemate
+            return -MATE_SCORE + ply if pos.in_check() else 0
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > alpha_orig:
+            bound = EXACT
+        else:
+            bound, best_move = UPPER, 0
+        self.tt.store(pos.hash, depth, bound, score_to_tt(best_score, ply), best_move)
+        return best_score
+
+    def _quiesce(self, pos, alpha, beta, ply):
+        '''
+        Search captures (and promotions) only, until the position is quiet,
+        so that leaves are not scored in the middle of an exchange. The side
+        to move may always stand pat on the static evaluation, and captures
+        that cannot bring the score back up to alpha are skipped (delta
+        pruning).
+        '''
+        self.nodes += 1
+        self.qnodes += 1
+        if not self.nodes & 2047:
+            self._check_time()
+        self._pv_table[ply] = []
+
+        stand_pat = evaluate(pos)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        best_score = stand_pat
+        board = pos.board
+        for move in self._order_captures(pos, pos.generate_moves(captures_only=True)):
+            victim = board[(move >> 6) & 63]
+            gain = PIECE_VALUES[victim % 6] if victim != NO_PIECE else PIECE_VALUES[PAWN]
+            if stand_pat + gain + DELTA_MARGIN <= alpha and not (move >> 12) & 7:
+                continue
+            pos.make(move)
+            if not pos.was_legal():
+                pos.unmake()
+                continue
+            score = -self._quiesce(pos, -beta, -alpha, ply + 1)
+            pos.unmake()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    self._pv_table[ply] = [move] + self._pv_table[ply + 1]
+                    if alpha >= beta:
+                        break
+        return best_score
+
+
+def score_to_tt(score, ply):
+    '''
+    Mate scores are stored relative to the node rather than the root
+    '''
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_DEPTH:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_DEPTH:
+        return score + ply
+    return score
+
+
+def search(board, depth=None, think_ms=None, searcher=None, stop_event=None):
+    '''
+    Find the best move for the side to move on a python-chess Board.
+
+    Args:
+        board: python-chess Board to search; it is not modified
+        depth: search depth in plies; with think_ms it only caps the depth
+        think_ms: optional wall-clock budget in milliseconds
+        searcher: Searcher to reuse between calls, a fresh one by default
+        stop_event: optional threading.Event that aborts the search when set
+
+    Returns:
+        SearchResult with a python-chess Move (None if there are no legal
+        moves) and the principal variation as python-chess Moves
+    '''
+    if searcher is None:
+        searcher = Searcher()
+    pos = Position.from_board(board)
+    result = searcher.search(pos, depth=depth, think_ms=think_ms, stop_event=stop_event)
+    move = pos.to_chess_move(result.move) if result.move else None
+    return result._replace(move=move, pv=[pos.to_chess_move(m) for m in result.pv])
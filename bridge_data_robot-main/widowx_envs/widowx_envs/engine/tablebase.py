@@ -0,0 +1,125 @@
+'''
+Syzygy endgame tablebase probing.
+
+Probing is done by python-chess, which memory-maps the .rtbw/.rtbz files and
+keeps at most max_open_tables of them open, closing the least recently used.
+This module adds root move selection by DTZ, a WDL probe for engine
+Positions at search leaves, and hit counters.
+'''
+
+import chess
+import chess.syzygy
+
+from widowx_envs.engine.bitboard import popcount
+
+# tablebase wins rank below every mate the search can find
+TB_WIN_SCORE = 90000
+
+# WDL values: -2 loss, -1 loss saved by the 50-move rule, 0 draw,
+# 1 win spoiled by the 50-move rule, 2 win
+WDL_SCORES = {-2: -TB_WIN_SCORE, -1: -1, 0: 0, 1: 1, 2: TB_WIN_SCORE}
+
+
+class Tablebase():
+    '''
+    Syzygy tablebases loaded from a local directory.
+
+    Only positions with at most max_pieces pieces and no castling rights
+    can be probed.
+    '''
+
+    def __init__(self, directory, max_open_tables=64, cache_size=100000):
+        self.directory = directory
+        self._tb = chess.syzygy.open_tablebase(directory, max_fds=max_open_tables)
+        # "KQvK" has three pieces
+        self.max_pieces = max((len(name) - 1 for name in self._tb.wdl), default=0)
+        self._cache_size = cache_size
+        self._wdl_cache = {}  # Position hash -> wdl, for leaf probes
+        self.probes = 0
+        self.hits = 0
+
+    def close(self):
+        self._tb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def covers(self, board):
+        return (bool(self.max_pieces) and chess.popcount(board.occupied) <= self.max_pieces
+                and not board.castling_rights)
+
+    def probe_wdl(self, board):
+        '''
+        WDL of a python-chess Board from the side to move's view, or None
+        '''
+        if not self.covers(board):
+            return None
+        self.probes += 1
+        wdl = self._tb.get_wdl(board)
+        if wdl is not None:
+            self.hits += 1
+        return wdl
+
+    def probe_position(self, pos):
+        '''
+        WDL of an engine Position, or None. Results are cached by hash since
+        the same leaves come up again and again during a search.
+        '''
+        if pos.castling or popcount(pos.occupied[0] | pos.occupied[1]) > self.max_pieces:
+            return None
+        # cache lookups count as probes, so hits never exceed probes
+        self.probes += 1
+        wdl = self._wdl_cache.get(pos.hash)
+        if wdl is not None:
+            self.hits += 1
+            return wdl
+        wdl = self._tb.get_wdl(chess.Board(pos.fen()))
+        if wdl is None:
+            return None
+        self.hits += 1
+        if len(self._wdl_cache) >= self._cache_size:
+            self._wdl_cache.clear()
+        self._wdl_cache[pos.hash] = wdl
+        return wdl
+
+    def root_move(self, board):
+        '''
+        Best move on board by the tables, or None if it is not covered.
+
+        Returns (move, wdl): the move keeping the best WDL; among winning
+        moves the one with the shortest distance to zeroing (DTZ), among
+        losing moves the longest.
+        '''
+        if not self.covers(board):
+            return None
+        best = None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    return move, 2
+                self.probes += 1
+                wdl_after = self._tb.get_wdl(board)
+                dtz_after = self._tb.get_dtz(board)
+            finally:
+                board.pop()
+            if wdl_after is None or dtz_after is None:
+                return None
+            self.hits += 1
+            wdl, dtz = -wdl_after, -dtz_after
+            # a zeroing move resets the 50-move counter, which is as good as dtz 0
+            zeroing = board.is_zeroing(move)
+            if wdl > 0:
+                key = (wdl, 0 if zeroing else -abs(dtz))
+            elif wdl < 0:
+                key = (wdl, abs(dtz))
+            else:
+                key = (wdl, 0)
+            if best is None or key > best[0]:
+                best = (key, move, wdl)
+        if best is None:
+            return None
+        return best[1], best[2]
@@ -0,0 +1,163 @@
+'''
+Fixed-size transposition table keyed by Zobrist hash.
+
+Each slot is two 64-bit words (index = key & mask): the packed entry and the
+key xor-ed with it. A slot whose words were written by two processes at once
+fails the key check and reads as a miss, so the table can be shared between
+worker processes without locks.
+
+Packed entry layout:
+
+    bits 0-16   best move
+    bits 17-37  score + SCORE_OFFSET
+    bits 38-44  depth
+    bits 45-46  bound
+    bits 47-54  age
+'''
+
+from array import array
+from multiprocessing.sharedctypes import RawArray
+
+# bound types; 0 marks an empty slot
+EXACT, LOWER, UPPER = 1, 2, 3
+
+ENTRY_BYTES = 16
+
+SCORE_OFFSET = 1 << 20
+MOVE_MASK = (1 << 17) - 1
+SCORE_MASK = (1 << 21) - 1
+
+
+def _pack(move, score, depth, bound, age):
+    return move | ((score + SCORE_OFFSET) << 17) | (depth << 38) | (bound << 45) | (age << 47)
+
+
+class TranspositionTable():
+    '''
+    Depth-preferred, age-aware transposition table.
+
+    A slot is replaced when it is empty, holds the same position, was written
+    during an earlier search, or the new entry is searched at least as deep.
+    The table is meant to live for a whole game: call new_search() before
+    every search so entries from previous moves are kept but age out first.
+
+    With shared=True the slots live in shared memory, and a table passed to
+    worker processes at pool start-up is the same table in every process
+    (the hit/miss counters stay per process).
+    '''
+
+    def __init__(self, size_mb=32, shared=False):
+        n = max(1, size_mb * 1024 * 1024 // ENTRY_BYTES)
+        self.size = 1 << (n.bit_length() - 1)  # round down to a power of two
+        self.mask = self.size - 1
+        self.shared = shared
+        if shared:
+            self._buffers = (RawArray('Q', self.size), RawArray('Q', self.size))
+        else:
+            self._buffers = (array('Q', [0]) * self.size, array('Q', [0]) * self.size)
+        self._bind()
+        self.age = 0
+        self.reset_stats()
+
+    def _bind(self):
+        if self.shared:
+            self.checks, self.entries = (memoryview(b).cast('B').cast('Q') for b in self._buffers)
+        else:
+            self.checks, self.entries = self._buffers
+
+    def __getstate__(self):
+        # only shared tables can cross process boundaries, and only at pool start-up
+        state = self.__dict__.copy()
+        del state["checks"], state["entries"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # probe found the slot taken by another position
+        self.stores = 0
+        self.overwrites = 0  # store evicted another position
+        self.rejected = 0  # store skipped because the slot held a deeper entry
+
+    def clear(self):
+        '''
+        Forget every entry, e.g. when a new game starts
+        '''
+        zeros = array('Q', [0]) * self.size
+        self.checks[:] = zeros
+        self.entries[:] = zeros
+        self.age = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        '''
+        Returns (depth, bound, score, move) for key, or None on a miss
+        '''
+        self.probes += 1
+        idx = key & self.mask
+        entry = self.entries[idx]
+        if entry:
+            if self.checks[idx] ^ entry == key:
+                self.hits += 1
+                return ((entry >> 38) & 0x7F, (entry >> 45) & 3,
+                        ((entry >> 17) & SCORE_MASK) - SCORE_OFFSET, entry & MOVE_MASK)
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def best_move(self, key):
+        '''
+        Stored move for key without touching the counters, 0 if unknown
+        '''
+        idx = key & self.mask
+        entry = self.entries[idx]
+        if entry and self.checks[idx] ^ entry == key:
+            return entry & MOVE_MASK
+        return 0
+
+    def store(self, key, depth, bound, score, move):
+        idx = key & self.mask
+        old = self.entries[idx]
+        if old:
+            same = self.checks[idx] ^ old == key
+            if not same and (old >> 47) == self.age and depth < (old >> 38) & 0x7F:
+                self.rejected += 1
+                return
+            if same and not move:
+                # keep the old best move rather than losing it
+                move = old & MOVE_MASK
+            if not same:
+                self.overwrites += 1
+        self.stores += 1
+        entry = _pack(move, score, depth, bound, self.age)
+        self.entries[idx] = entry
+        self.checks[idx] = key ^ entry
+
+    def hashfull(self, sample=1000):
+        '''
+        Permille of used slots, estimated from the first `sample` slots
+        '''
+        sample = min(sample, self.size)
+        used = sum(1 for i in range(sample) if self.entries[i])
+        return used * 1000 // sample
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "hashfull": self.hashfull(),
+        }
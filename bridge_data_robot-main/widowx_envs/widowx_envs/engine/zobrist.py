@@ -0,0 +1,60 @@
+'''
+Zobrist keys for incremental position hashing.
+
+The keys are the Polyglot random numbers shipped with python-chess, so a
+Position hash equals chess.polyglot.zobrist_hash() of the same position.
+'''
+
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+
+from widowx_envs.engine.bitboard import WHITE, BLACK, PAWN_ATTACKS, iter_bits
+
+# PIECE_KEYS[piece][sq] for the engine's colored piece index (color * 6 + type)
+PIECE_KEYS = []
+for _color in (WHITE, BLACK):
+    for _pt in range(6):
+        _kind = _pt * 2 + (1 if _color == WHITE else 0)
+        PIECE_KEYS.append([POLYGLOT_RANDOM_ARRAY[64 * _kind + sq] for sq in range(64)])
+
+# CASTLING_KEYS[rights] for every combination of the four rights bits
+CASTLING_KEYS = []
+for _rights in range(16):
+    _key = 0
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            _key ^= POLYGLOT_RANDOM_ARRAY[768 + _bit]
+    CASTLING_KEYS.append(_key)
+
+EP_FILE_KEYS = POLYGLOT_RANDOM_ARRAY[772:780]
+
+# xor-ed in whenever white is to move
+WHITE_TO_MOVE_KEY = POLYGLOT_RANDOM_ARRAY[780]
+
+
+def ep_key(pos):
+    '''
+    En passant key, only counted when a pawn of the side to move can
+    actually capture on the en passant square
+    '''
+    if pos.ep < 0:
+        return 0
+    side = pos.side
+    if PAWN_ATTACKS[side ^ 1][pos.ep] & pos.pieces[side * 6]:
+        return EP_FILE_KEYS[pos.ep & 7]
+    return 0
+
+
+def compute_hash(pos):
+    '''
+    Hash of pos computed from scratch
+    '''
+    h = 0
+    for piece in range(12):
+        keys = PIECE_KEYS[piece]
+        for sq in iter_bits(pos.pieces[piece]):
+            h ^= keys[sq]
+    h ^= CASTLING_KEYS[pos.castling]
+    h ^= ep_key(pos)
+    if pos.side == WHITE:
+        h ^= WHITE_TO_MOVE_KEY
+    return h
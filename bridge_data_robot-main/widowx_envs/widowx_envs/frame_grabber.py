@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class FrameGrabber():
+    '''
+    Reads a cv2.VideoCapture on a background thread and keeps only the
+    latest frame, so callers never get a frame that sat in the driver's
+    buffer and never need to flush it with throwaway reads.
+
+    With threaded=False (recorded sources) nothing runs in the background
+    and every read() takes the next frame from the source.
+
+    Counters:
+        frames: frames read from the camera
+        dropped: frames replaced by a newer one before anybody read them
+        failures: failed cap.read() calls
+    '''
+
+    def __init__(self, cap, threaded=True):
+        self.cap = cap
+        self.threaded = threaded
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = 0.0 # time.monotonic() when the latest frame was read
+        self._consumed = True
+        self._running = False
+        self._thread = None
+        self.frames = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def start(self):
+        if self._running or not self.threaded:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            ok, frame = self.cap.read()
+            now = time.monotonic()
+            if not ok:
+                self.failures += 1
+                time.sleep(0.01)
+                continue
+            with self._cond:
+                if not self._consumed:
+                    self.dropped += 1
+                self._frame = frame
+                self._timestamp = now
+                self._consumed = False
+                self.frames += 1
+                self._cond.notify_all()
+
+    def read(self, newer_than=None, timeout=1.0):
+        '''
+        Latest frame as (timestamp, frame). With newer_than (a time.monotonic()
+        value), waits until a frame read after that time arrives; raises
+        TimeoutError if none comes within timeout seconds.
+        '''
+        if not self.threaded:
+            ok, frame = self.cap.read()
+            if not ok:
+                self.failures += 1
+                raise TimeoutError("frame source returned no frame")
+            self.frames += 1
+            self._frame, self._timestamp = frame, time.monotonic()
+            return self._timestamp, frame
+        if newer_than is None:
+            newer_than = -1.0
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame is not None and self._timestamp > newer_than,
+                                       timeout):
+                raise TimeoutError("no new camera frame within {:.1f}s".format(timeout))
+            self._consumed = True
+            return self._timestamp, self._frame
+
+    @property
+    def frame_age(self):
+        '''
+        Seconds since the latest frame was read, None before the first one
+        '''
+        if self._frame is None:
+            return None
+        return time.monotonic() - self._timestamp
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "frame_age": self.frame_age,
+        }
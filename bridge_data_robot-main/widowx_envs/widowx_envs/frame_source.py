@@ -0,0 +1,63 @@
+import glob
+import os
+
+import cv2
+
+
+class VideoSource():
+    '''
+    Frames from cv2.VideoCapture: a camera index (live) or a video file.
+    Live sources are read on a background thread by BoardView; recorded
+    ones are read on demand so that no frame is skipped.
+    '''
+
+    def __init__(self, source=0, live=None):
+        self.cap = cv2.VideoCapture(source)
+        self.live = isinstance(source, int) if live is None else live
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageSource():
+    '''
+    Frames from still images, for replaying recorded board states without
+    the rig. read() keeps returning the current image until seek() selects
+    another, or with step=True moves to the next image on every read and
+    fails after the last one.
+    '''
+
+    live = False
+
+    def __init__(self, paths, step=False):
+        self.paths = list(paths)
+        self.step = step
+        self.index = 0
+        self._images = {}
+
+    @classmethod
+    def from_directory(cls, directory, pattern="*.jpg", step=False):
+        return cls(sorted(glob.glob(os.path.join(directory, pattern))), step=step)
+
+    def seek(self, image):
+        '''
+        Make image (an index or one of the paths) the current image
+        '''
+        self.index = self.paths.index(image) if isinstance(image, str) else image
+
+    def read(self):
+        if self.index >= len(self.paths):
+            return False, None
+        path = self.paths[self.index]
+        if path not in self._images:
+            self._images[path] = cv2.imread(path)
+        if self.step:
+            self.index += 1
+        frame = self._images[path]
+        return frame is not None, frame
+
+    def release(self):
+        self._images.clear()
@@ -0,0 +1,113 @@
+'''
+Joint solutions of end-effector poses, kept across runs so that moves to
+poses seen before (the same squares every game) skip inverse kinematics
+and become joint-space commands.
+
+Poses are [x, y, z, roll, pitch, yaw] vectors, looked up after rounding.
+The cache file records a calibration hash of what the solutions depend on
+(the robot description and joint limits); a file made for a different
+calibration is ignored.
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def calibration_hash(*arrays):
+    '''
+    Short hash of the given arrays of numbers
+    '''
+    digest = hashlib.sha1()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class IKCache():
+    '''
+    Pose -> joint angles table, persisted as JSON at path.
+
+    Counters:
+        hits, misses: lookups answered from the cache or not
+        solves, solve_seconds: IK solutions added and the seconds they took
+    '''
+
+    def __init__(self, path=None, calibration=None, decimals=6):
+        self.path = path
+        self.calibration = calibration
+        self.decimals = decimals
+        self.solutions = {}
+        self.dirty = False # solutions added since the last save
+        self.hits = 0
+        self.misses = 0
+        self.solves = 0
+        self.solve_seconds = 0.0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def key(self, pose):
+        return tuple(np.round(np.asarray(pose, dtype=np.float64), self.decimals).tolist())
+
+    def __len__(self):
+        return len(self.solutions)
+
+    def __contains__(self, pose):
+        return self.key(pose) in self.solutions
+
+    def get(self, pose):
+        '''
+        Joint angles cached for pose, None if there are none
+        '''
+        joints = self.solutions.get(self.key(pose))
+        if joints is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.array(joints)
+
+    def put(self, pose, joints, seconds=None):
+        '''
+        Store the joint angles solved for pose, and how long solving took
+        '''
+        self.solutions[self.key(pose)] = [float(j) for j in joints]
+        self.dirty = True
+        if seconds is not None:
+            self.solves += 1
+            self.solve_seconds += seconds
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("calibration") != self.calibration:
+            print("IK cache {} was made for another calibration, ignoring it".format(self.path))
+            return
+        self.solutions = dict((tuple(pose), joints) for pose, joints in zip(data["poses"], data["joints"]))
+        # keep the solve time estimate of the run that filled the cache
+        self.solves = data.get("solves", 0)
+        self.solve_seconds = data.get("solve_seconds", 0.0)
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path, "w") as f:
+            json.dump({"calibration": self.calibration,
+                       "solves": self.solves,
+                       "solve_seconds": self.solve_seconds,
+                       "poses": list(self.solutions.keys()),
+                       "joints": list(self.solutions.values())}, f)
+        self.dirty = False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        mean_solve = self.solve_seconds / self.solves if self.solves else 0.0
+        return {
+            "entries": len(self.solutions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "ik_seconds": self.solve_seconds,
+            "saved_seconds": self.hits * mean_solve, # IK time the hits would have cost
+        }
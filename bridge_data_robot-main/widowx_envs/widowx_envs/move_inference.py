@@ -0,0 +1,75 @@
+'''
+Infer the player's move from how much each square changed on camera.
+
+Every legal move touches a known set of squares: two for a normal move or
+capture, three for en passant (the captured pawn's square too) and four for
+castling (king and rook). Moves are rows of a 0/1 incidence matrix over the
+64 squares, so all of them are scored against the observed changes with one
+matrix product and the best scoring legal move wins.
+
+Changes are normalized to robust z-scores (median and median absolute
+deviation, as most squares do not change), and a move touching k squares
+scores sum(z over its squares) / sqrt(k). That is the likelihood ratio test
+for "these k squares changed by the same unknown amount" and, unlike the
+mean change, does not let two squares of a castling beat all four.
+'''
+
+import chess
+import numpy as np
+
+
+def move_squares(board, move):
+    '''
+    Squares whose contents change when move is played on board
+    '''
+    squares = [move.from_square, move.to_square]
+    if board.is_en_passant(move):
+        squares.append(move.to_square - 8 if board.turn == chess.WHITE else move.to_square + 8)
+    elif board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if board.is_kingside_castling(move):
+            squares += [chess.square(7, rank), chess.square(5, rank)]
+        else:
+            squares += [chess.square(0, rank), chess.square(3, rank)]
+    return squares
+
+
+class MoveInference():
+    '''
+    Legal moves of a position and their square incidence matrix, built once
+    (e.g. while waiting for the player) and used to score camera changes.
+    '''
+
+    def __init__(self, board):
+        # queen promotions first so that they win ties with underpromotions
+        self.moves = sorted(board.legal_moves, key=lambda m: m.promotion not in (None, chess.QUEEN))
+        self.incidence = np.zeros((len(self.moves), 64), dtype=np.float64)
+        for i, move in enumerate(self.moves):
+            self.incidence[i, move_squares(board, move)] = 1.0
+        self._weights = self.incidence / np.sqrt(self.incidence.sum(axis=1, keepdims=True))
+
+    def scores(self, changes):
+        '''
+        Score of every legal move for changes, an array of 64 change scores
+        indexed by chess square (higher means more changed)
+        '''
+        changes = np.asarray(changes, dtype=np.float64)
+        median = np.median(changes)
+        spread = np.median(np.abs(changes - median)) * 1.4826 + 1e-9
+        return self._weights @ ((changes - median) / spread)
+
+    def infer(self, changes):
+        '''
+        Most likely legal move and its score margin over the runner-up (in
+        standard deviations), or (None, 0.0) if there are no legal moves
+        '''
+        if not self.moves:
+            return None, 0.0
+        scores = self.scores(changes)
+        best = int(np.argmax(scores))
+        move = self.moves[best]
+        # promotions to different pieces look the same, compare against other squares only
+        others = [s for m, s in zip(self.moves, scores)
+                  if (m.from_square, m.to_square) != (move.from_square, move.to_square)]
+        margin = scores[best] - max(others) if others else float("inf")
+        return move, float(margin)
@@ -0,0 +1,70 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MoveWatcher():
+    '''
+    Detects that the player finished a move by watching the board for motion.
+
+    Every camera frame of the board is downsampled and compared with the
+    previous one; the mean absolute difference is the frame's change energy.
+    A hand over the board pushes the energy above enter_threshold. Once it
+    has been below settle_threshold for settle_frames frames in a row the
+    hand is gone and the move counts as completed.
+
+    Counters:
+        moves: completed moves detected
+        settle_latency: seconds from the last moving frame to the detection,
+            for the last move
+    '''
+
+    def __init__(self, board_view, scale=0.25, enter_threshold=8.0, settle_threshold=2.0,
+                 settle_frames=8):
+        self.board_view = board_view
+        self.scale = scale
+        self.enter_threshold = enter_threshold
+        self.settle_threshold = settle_threshold
+        self.settle_frames = settle_frames
+        self.moves = 0
+        self.settle_latency = None
+
+    def _read(self):
+        # blur a little so sensor noise does not count as motion
+        frame = self.board_view.read_board(self.scale)
+        return cv2.GaussianBlur(frame, (3, 3), 0).astype(np.int16)
+
+    def change_energy(self, frame, previous):
+        return float(np.mean(np.abs(frame - previous)))
+
+    def wait_for_move(self, timeout=None):
+        '''
+        Block until a hand has entered the board and the scene has been
+        still for settle_frames frames since it left. Returns False if
+        timeout (seconds) passed first.
+        '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        previous = self._read()
+        entered = False
+        still = 0
+        last_motion = None
+        while deadline is None or time.monotonic() < deadline:
+            frame = self._read()
+            energy = self.change_energy(frame, previous)
+            previous = frame
+
+            if energy > self.enter_threshold:
+                entered = True
+            if energy > self.settle_threshold:
+                still = 0
+                last_motion = time.monotonic()
+                continue
+            if not entered:
+                continue
+            still += 1
+            if still >= self.settle_frames:
+                self.moves += 1
+                self.settle_latency = time.monotonic() - last_motion
+                return True
+        return False
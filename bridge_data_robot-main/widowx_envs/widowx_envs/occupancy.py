@@ -0,0 +1,144 @@
+'''
+Classify every square of the board as empty, white piece or black piece
+from a single color image of the board.
+
+All 64 squares are handled at once: the board image is split into cells
+(BoardView.square_blocks), each cell's center is reduced to a few color
+statistics in Lab space (mean lightness and chroma, lightness spread and
+its darkest and brightest tenth, where piece bodies show) and
+the squares are matched to the nearest class centroid. Light and dark
+squares look different when empty, so each has its own centroids; they
+are calibrated from one image of a known position, e.g. the starting
+position before the game.
+
+reconcile compares a classification with a chess.Board, and
+best_matching_moves ranks legal moves by how well the position after them
+agrees with what the camera sees.
+'''
+
+import chess
+import cv2
+import numpy as np
+
+EMPTY, WHITE_PIECE, BLACK_PIECE = 0, 1, 2
+CLASS_NAMES = ("empty", "white", "black")
+
+# square colour of every square; which of 0 and 1 is light depends on the board
+SQUARE_COLOURS = np.array([(chess.square_file(sq) + chess.square_rank(sq)) % 2 for sq in chess.SQUARES])
+
+
+def board_occupancy(board):
+    '''
+    Expected class of every square of a chess.Board, as an array indexed by square
+    '''
+    occupancy = np.full(64, EMPTY, dtype=np.int64)
+    occupancy[list(chess.SquareSet(board.occupied_co[chess.WHITE]))] = WHITE_PIECE
+    occupancy[list(chess.SquareSet(board.occupied_co[chess.BLACK]))] = BLACK_PIECE
+    return occupancy
+
+
+def square_features(blocks, center=0.5):
+    '''
+    Features of every cell of blocks (64 x h x w x 3 BGR cells): mean L, a
+    and b, the standard deviation of L and its 10th and 90th percentiles,
+    over the central center fraction of the cell, where pieces stand and
+    grid lines do not reach
+    '''
+    n, h, w = blocks.shape[:3]
+    y0, x0 = int(h * (1 - center) / 2), int(w * (1 - center) / 2)
+    crops = np.ascontiguousarray(blocks[:, y0:h - y0, x0:w - x0])
+    # one color conversion for all cells, stacked as a single tall image
+    lab = cv2.cvtColor(crops.reshape(-1, crops.shape[2], 3), cv2.COLOR_BGR2LAB)
+    lab = lab.reshape(n, -1, 3).astype(np.float32)
+    lightness = lab[:, :, 0]
+    return np.column_stack([lab.mean(axis=1), lightness.std(axis=1),
+                            np.percentile(lightness, (10, 90), axis=1).T])
+
+
+class OccupancyClassifier():
+    '''
+    Nearest centroid classifier over square_features, with centroids per
+    square colour and class, and features scaled by their
+    pooled within-class spread.
+    '''
+
+    def __init__(self, center=0.5):
+        self.center = center
+        self.centroids = None # [square colour][class] -> feature vector
+        self.scale = None
+
+    @property
+    def calibrated(self):
+        return self.centroids is not None
+
+    def fit(self, blocks, board):
+        '''
+        Calibrate from the cells of an image of board (a chess.Board that
+        has all three classes on both square colours, like the start)
+        '''
+        features = square_features(blocks, self.center)
+        occupancy = board_occupancy(board)
+        centroids = np.zeros((2, 3, features.shape[1]), dtype=np.float32)
+        residuals = []
+        for cls in (EMPTY, WHITE_PIECE, BLACK_PIECE):
+            if not np.any(occupancy == cls):
+                raise ValueError("calibration board has no {} squares".format(CLASS_NAMES[cls]))
+            for colour in (0, 1):
+                mask = (occupancy == cls) & (SQUARE_COLOURS == colour)
+                if not np.any(mask):
+                    # class missing on this square colour, fall back to both colours
+                    mask = occupancy == cls
+                centroids[colour, cls] = features[mask].mean(axis=0)
+            mask = occupancy == cls
+            residuals.append(features[mask] - centroids[SQUARE_COLOURS[mask], cls])
+        self.centroids = centroids
+        self.scale = np.concatenate(residuals).std(axis=0) + 1.0
+        return self
+
+    def distances(self, blocks):
+        '''
+        Scaled distance of every square to each class, 64 x 3
+        '''
+        if not self.calibrated:
+            raise RuntimeError("OccupancyClassifier must be fit before it can classify")
+        features = square_features(blocks, self.center)
+        offsets = (features[:, None, :] - self.centroids[SQUARE_COLOURS]) / self.scale
+        return np.sqrt((offsets * offsets).sum(axis=2))
+
+    def predict(self, blocks):
+        '''
+        Class of every square (EMPTY, WHITE_PIECE or BLACK_PIECE), indexed by square
+        '''
+        return np.argmin(self.distances(blocks), axis=1)
+
+
+def reconcile(board, occupancy):
+    '''
+    Squares where the classified occupancy disagrees with board, as
+    {square: (expected class, observed class)}
+    '''
+    expected = board_occupancy(board)
+    return dict((int(sq), (int(expected[sq]), int(occupancy[sq])))
+                for sq in np.flatnonzero(expected != occupancy))
+
+
+def describe_mismatches(mismatches):
+    '''
+    Readable summary of reconcile's output, e.g. "e4 (expected white, seen empty)"
+    '''
+    return ", ".join("{} (expected {}, seen {})".format(chess.square_name(sq), CLASS_NAMES[expected],
+                                                       CLASS_NAMES[observed])
+                     for sq, (expected, observed) in sorted(mismatches.items()))
+
+
+def best_matching_moves(board, occupancy, moves=None):
+    '''
+    Legal moves of board (or the given moves) with the number of squares
+    where the position after them disagrees with occupancy, fewest first
+    '''
+    ranked = []
+    for move in (board.legal_moves if moves is None else moves):
+        board.push(move)
+        ranked.append((move, int(np.count_nonzero(board_occupancy(board) != occupancy))))
+        board.pop()
+    return sorted(ranked, key=lambda item: item[1])
@@ -4,6 +4,7 @@ import argparse
 import numpy as np
 import math
 import time
+from contextlib import contextmanager
 from widowx_envs.widowx_env_service import WidowXClient, WidowXConfigs, WidowXStatus
 
 def distance_from_zero_zero(point):
@@ -48,7 +49,122 @@ def find_placing_droop(pickup_point, place_point):
     return max(pickup_disp - max(place_disp, 0.3), 0) * -0.0529
 
 
-def pick_and_place(xy_initial, xy_final, height, clearance_height, client, gripper_width=0.8,blocking=True):
+HOME_POSE = np.array([0.15, 0, 0.15, 0, 1.5, 0])
+CLEAR_VIEW_POSE = np.array([0.1, 0, 0.15, 0, 1.5, 0]) # out of the way so the camera can read the move
+
+
+def waypoints(xy_initial, xy_final, height, clearance_height):
+    '''
+    Every pose pick_and_place moves to, by name, as [x, y, z, roll, pitch, yaw]
+    '''
+    x_initial, y_initial = xy_initial[0], xy_initial[1]
+    x_final, y_final = xy_final[0], xy_final[1]
+
+    pickup_droop = find_pickup_droop(xy_initial)
+    placing_droop = find_placing_droop(xy_initial, xy_final)
+
+    height -= pickup_droop
+
+    return {
+        "home": HOME_POSE,
+        # don't roll above the piece so the IK solver doesn't freak out
+        "hover_pick": np.array([x_initial, y_initial, clearance_height+height, 0, 1.5, 0]),
+        "hover_pick_rolled": np.array([x_initial, y_initial, clearance_height+height, 0, 1.5, np.pi / 4]),
+        "grasp": np.array([x_initial, y_initial, height, 0, 1.5, np.pi / 4]),
+        "hover_place_rolled": np.array([x_final, y_final, clearance_height+height, 0, 1.5, np.pi / 4]),
+        "place": np.array([x_final, y_final, height+placing_droop, 0, 1.5, np.pi / 4]),
+        # un-roll before leaving so the IK solver doesn't freak out
+        "hover_place": np.array([x_final, y_final, clearance_height+height, 0, 1.5, 0]),
+        "clear_view": CLEAR_VIEW_POSE,
+    }
+
+
+# with blending, the waypoints of pick_and_place in three trajectories that only
+# stop where the gripper acts: (segment name, waypoints, gripper step after it)
+BLEND_PHASES = [
+    ("to grasp", ["home", "hover_pick", "hover_pick_rolled", "grasp"], "grasp"),
+    ("carry", ["hover_pick_rolled", "hover_place_rolled", "place"], "release"),
+    ("clear view", ["hover_place_rolled", "hover_place", "clear_view"], None),
+]
+
+
+class MotionTimer():
+    '''
+    Wall time of every segment of a pick and place next to the time the
+    server reported moving, so the slack (network, IK, scheduling) shows.
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.segments = [] # (name, wall seconds, motion seconds or None)
+        self.status = WidowXStatus.SUCCESS # of the first step that failed
+
+    def record(self, status):
+        '''
+        Keep the status of a step, True if the sequence can go on. An arm that
+        did not settle is close enough to carry on from.
+        '''
+        if status == WidowXStatus.NOT_SETTLED:
+            print(f"Step {self.segments[-1][0]} did not settle, carrying on")
+        elif status != WidowXStatus.SUCCESS:
+            self.status = status
+            print(f"Step {self.segments[-1][0]} failed (status {status}), stopping")
+            return False
+        return True
+
+    @contextmanager
+    def segment(self, name):
+        start = time.monotonic()
+        yield
+        self.segments.append((name, time.monotonic() - start, self.client.last_motion_time))
+
+    @property
+    def total(self):
+        return sum(wall for _, wall, _ in self.segments)
+
+    def report(self):
+        print(f"{'segment':<14} {'wall':>7} {'motion':>7} {'slack':>7}")
+        for name, wall, motion in self.segments:
+            if motion is None:
+                print(f"{name:<14} {wall:>6.2f}s {'-':>7} {'-':>7}")
+            else:
+                print(f"{name:<14} {wall:>6.2f}s {motion:>6.2f}s {wall - motion:>6.2f}s")
+        motion = sum(m for _, _, m in self.segments if m is not None)
+        print(f"{'total':<14} {self.total:>6.2f}s {motion:>6.2f}s {self.total - motion:>6.2f}s")
+
+
+def blended_pick_and_place(poses, client, gripper_width, blocking, timer):
+    '''
+    The moves of pick_and_place as the trajectories of BLEND_PHASES. A phase
+    the server can't plan (EXECUTION_FAILURE, e.g. a waypoint without IK
+    solution) is moved one waypoint at a time instead; the arm hasn't moved
+    then. Any other failure stops the sequence, as in pick_and_place.
+    '''
+    with timer.segment("open"):
+        status = client.move_gripper(gripper_width, blocking=blocking)
+    if not timer.record(status):
+        return
+    for name, names, gripper in BLEND_PHASES:
+        with timer.segment(name):
+            status = client.move_through(np.array([poses[n] for n in names]), blocking=blocking)
+        if status == WidowXStatus.EXECUTION_FAILURE:
+            print(f"No trajectory for {name}, moving one pose at a time")
+            for n in names:
+                with timer.segment(n.replace("_", " ")):
+                    status = client.move(poses[n], blocking=blocking)
+                if not timer.record(status):
+                    return
+        elif not timer.record(status):
+            return
+        if gripper is not None:
+            with timer.segment(gripper):
+                status = client.move_gripper(0.0 if gripper == "grasp" else gripper_width, blocking=blocking)
+            if not timer.record(status):
+                return
+
+
+def pick_and_place(xy_initial, xy_final, height, clearance_height, client, gripper_width=0.8,blocking=True,
+                   blend=False, verbose=True):
     '''
     Pick up an object at a certain position  and place it at a different position.
 
@@ -58,68 +174,76 @@ def pick_and_place(xy_initial, xy_final, height, clearance_height, client, gripp
         height: height of object
         clearance_height: height the object must be raised to ensure it doesn't hit any other objects
         client: the client used to control the robot
-    '''
-    x_initial = xy_initial[0]
-    y_initial = xy_initial[1]
-    x_final = xy_final[0]
-    y_final = xy_final[1]
+        blocking: wait for every motion to settle before the next one is sent
+        blend: move in planned joint-space trajectories that pass the hover
+            waypoints without stopping (see blended_pick_and_place)
+        verbose: print the time of every segment
 
-    pickup_droop = find_pickup_droop(xy_initial)
-    placing_droop = find_placing_droop(xy_initial, xy_final)
+    Stops at the first step that fails, after one back off and retry where
+    the arm may just have had no path to the pose.
 
-    height -= pickup_droop
-
-    # Move home
-    client.move_gripper(gripper_width)
-    time.sleep(1.5)
-    move = client.move(np.array([0.15, 0, 0.15, 0, 1.5, 0]),blocking=blocking)
-    if move == 2: # in case it can't find a path directly to its final point
-        client.step_action(np.array([-0.05, 0, 0, 0, 0,0, gripper_width]),blocking=blocking)
-        time.sleep(1.5)
-        client.move(np.array([0.15, 0, 0.15, 0, 1.5, 0 / 4]),blocking=blocking)
-    time.sleep(1.5)
-
-    # Pick up piece
-    client.move(np.array([x_initial, y_initial, clearance_height+height, 0, 1.5, 0]),blocking=blocking) # don't roll here so the IK solver doesn't freak out
-    time.sleep(1.5)
-    client.move(np.array([x_initial, y_initial, clearance_height+height, 0, 1.5, np.pi / 4]),blocking=blocking) # roll
-    time.sleep(1.5)
-    client.move(np.array([x_initial, y_initial, height, 0, 1.5, np.pi / 4]),blocking=blocking)
-    time.sleep(1.5)
-    client.move_gripper(0.0)
-    time.sleep(1.5)
-    client.move(np.array([x_initial, y_initial, clearance_height+height, 0, 1.5, np.pi / 4]),blocking=blocking)
-    time.sleep(1.5)
-
-    # Move piece to final location
-    move = client.move(np.array([x_final, y_final, clearance_height+height, 0, 1.5, np.pi / 4]),blocking=blocking)
-    print(move)
-    if move == 2: # in case it can't find a path directly to its final point
-        client.step_action(np.array([-0.05, 0, 0.05, 0, 0,0, 0]),blocking=blocking)
-        time.sleep(1.5)
-        client.move(np.array([x_final, y_final, clearance_height+height, 0, 1.5, np.pi / 4]),blocking=blocking)
-    time.sleep(1.5)
-
-    # Placing step
-    client.move(np.array([x_final, y_final, height+placing_droop, 0, 1.5, np.pi / 4]),blocking=blocking)
-    time.sleep(1.5)
-    client.move_gripper(gripper_width) # moves to narrow if narrow, otherwise opens fully
-    time.sleep(1.5)
-    client.move(np.array([x_final, y_final, clearance_height+height, 0, 1.5, np.pi / 4]),blocking=blocking)
-    time.sleep(1.5)
-    client.move(np.array([x_final, y_final, clearance_height+height, 0, 1.5, 0]),blocking=blocking) # Un-roll so the IK solver doesn't freak out
-    time.sleep(1.5)
-    move = client.move(np.array([0.1, 0, 0.15, 0, 1.5, 0]),blocking=blocking) # Move out of the way so camera can read move
-    if move == 2: # in case it can't find a path directly to its final point
-        client.step_action(np.array([-0.05, 0, 0, 0, 0, 0, 1]),blocking=blocking)
-        time.sleep(1.5)
-        client.move(np.array([0.1, 0, 0.15, 0, 1.5, 0]),blocking=blocking) # Move home
+    Returns the MotionTimer with the time of every segment and, in status,
+    the first failure.
+    '''
+    poses = waypoints(xy_initial, xy_final, height, clearance_height)
+
+    timer = MotionTimer(client)
+
+    if blend:
+        blended_pick_and_place(poses, client, gripper_width, blocking, timer)
+        if verbose:
+            timer.report()
+        return timer
+
+    def move(name, pose, back_off=None):
+        with timer.segment(name):
+            status = client.move(poses[pose], blocking=blocking)
+        if status == WidowXStatus.EXECUTION_FAILURE and back_off is not None:
+            # in case it can't find a path directly to its final point
+            with timer.segment(name + " back off"):
+                client.step_action(back_off, blocking=blocking)
+            with timer.segment("retry"):
+                status = client.move(poses[pose], blocking=blocking)
+        return status
+
+    def gripper(name, width):
+        with timer.segment(name):
+            return client.move_gripper(width, blocking=blocking)
+
+    steps = [
+        # Move home
+        lambda: gripper("open", gripper_width),
+        lambda: move("home", "home", back_off=np.array([-0.05, 0, 0, 0, 0, 0, gripper_width])),
+        # Pick up piece
+        lambda: move("hover pick", "hover_pick"),
+        lambda: move("roll", "hover_pick_rolled"),
+        lambda: move("descend", "grasp"),
+        lambda: gripper("grasp", 0.0),
+        lambda: move("lift", "hover_pick_rolled"),
+        # Move piece to final location
+        lambda: move("carry", "hover_place_rolled", back_off=np.array([-0.05, 0, 0.05, 0, 0, 0, 0])),
+        # Placing step
+        lambda: move("descend", "place"),
+        lambda: gripper("release", gripper_width), # moves to narrow if narrow, otherwise opens fully
+        lambda: move("lift", "hover_place_rolled"),
+        lambda: move("unroll", "hover_place"),
+        lambda: move("clear view", "clear_view", back_off=np.array([-0.05, 0, 0, 0, 0, 0, 1])),
+    ]
+    for step in steps:
+        if not timer.record(step()):
+            break
+
+    if verbose:
+        timer.report()
+    return timer
     
 
 def main():
     parser = argparse.ArgumentParser(description='Pick and Place for WidowX Robot')
     parser.add_argument('--ip', type=str, default='localhost')
     parser.add_argument('--port', type=int, default=5556)
+    parser.add_argument('--blend', action='store_true',
+                        help='move in planned trajectories that blend through the hover waypoints')
     args = parser.parse_args()
 
     client = WidowXClient(host=args.ip, port=args.port)
@@ -137,11 +261,11 @@ def main():
 
     # pick_and_place([0.225, -0.135], [0.15, -0.135], 0.02, 0.08, client, gripper_width=0.7)
 
-    pick_and_place([0.15, -0.135], [0.25, -0.135], 0.02, 0.1, client, gripper_width=0.7)
+    pick_and_place([0.15, -0.135], [0.25, -0.135], 0.02, 0.1, client, gripper_width=0.7, blend=args.blend)
 
-    pick_and_place([0.45, -0.135], [0.3, -0.135], 0.000, 0.1, client, gripper_width=0.7)
+    pick_and_place([0.45, -0.135], [0.3, -0.135], 0.000, 0.1, client, gripper_width=0.7, blend=args.blend)
 
-    pick_and_place([0.3, -0.135], [0.15, -0.135], 0.000, 0.1, client, gripper_width=0.7)
+    pick_and_place([0.3, -0.135], [0.15, -0.135], 0.000, 0.1, client, gripper_width=0.7, blend=args.blend)
 
     # pick_and_place([0.15, -0.14], [0.3, 0.28], 0.023, 0.08, client, gripper_width=0.7)
     # time.sleep(4)
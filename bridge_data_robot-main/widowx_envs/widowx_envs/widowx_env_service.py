@@ -10,6 +10,7 @@ import traceback
 
 from typing import Optional, Tuple, Any
 from widowx_envs.utils.exceptions import Environment_Exception
+from widowx_envs.ik_cache import IKCache, calibration_hash
 
 # install from: https://github.com/youliangtan/edgeml
 from edgeml.action import ActionClient, ActionServer, ActionConfig
@@ -38,7 +39,8 @@ class WidowXConfigs:
 
     DefaultActionConfig = ActionConfig(
         port_number=5556,
-        action_keys=["init", "move", "gripper", "reset", "step_action", "reboot_motor"],
+        action_keys=["init", "move", "gripper", "reset", "step_action", "reboot_motor", "pick_place",
+                     "ik_calibrate", "move_through"],
         observation_keys=["image", "state", "full_image"],
         broadcast_port=5556 + 1,
     )
@@ -52,8 +54,10 @@ def print_red(x): return print("\033[91m{}\033[00m".format(x))
 class WidowXStatus:
     NO_CONNECTION = 0
     SUCCESS = 1
-    EXECUTION_FAILURE = 2
+    EXECUTION_FAILURE = 2  # nowhere to go, e.g. no IK solution for the pose
     NOT_INITIALIZED = 3
+    NOT_SETTLED = 4  # moved, but the joints did not settle at the target in time
+    EFFORT_EXCEEDED = 5  # a joint pushed too hard, the arm went back to neutral
 
 ##############################################################################
 
@@ -65,7 +69,8 @@ class WidowXActionServer():
     reveives the observation and control the widowx robot.
     """
 
-    def __init__(self, port: int = 5556, testing: bool = False):
+    def __init__(self, port: int = 5556, testing: bool = False, ik_cache_path: Optional[str] = None,
+                 settle_tolerance: Optional[float] = None, settle_timeout: Optional[float] = None):
         edgeml_config = WidowXConfigs.DefaultActionConfig
         edgeml_config.port_number = port
         edgeml_config.broadcast_port = port + 1
@@ -79,13 +84,24 @@ class WidowXActionServer():
 
         self._env_params = {}  # default nothing
         self._image_size = None  # default None
+        self._motion_time = None  # seconds the last action spent moving, sent with the reply
+        self._segments = None  # (name, wall seconds, motion seconds) of the last pick_place
+        self._ik_cache_path = ik_cache_path
+        self.ik_cache = None  # joint solutions of poses, loaded once the robot is initialized
+        # how close (rad) the joints have to get for a blocking move to be done, the
+        # controller's default if None, and how long to wait for it, 2 * duration + 2 s if None
+        self._settle_tolerance = settle_tolerance
+        self._settle_timeout = settle_timeout
         self._action_methods = {
             "init": self.__init,
             "gripper": self.__gripper,
             "move": self.__move,
+            "move_through": self.__move_through,
             "step_action": self.__step_action,
             "reset": self.__reset,
             "reboot_motor": self.__reboot_motor,
+            "pick_place": self.__pick_place,
+            "ik_calibrate": self.__ik_calibrate,
         }
 
     def start(self, threaded: bool = False):
@@ -97,6 +113,8 @@ class WidowXActionServer():
     def stop(self):
         """Stop the server."""
         self.__server.stop()
+        if self.ik_cache is not None and self.ik_cache.dirty:
+            self.ik_cache.save()
         return WidowXStatus.SUCCESS
 
     def init_robot(self, env_params, image_size):
@@ -129,6 +147,15 @@ class WidowXActionServer():
             _env_params, fixed_image_size=image_size)
         print("Initialized bridge env.")
 
+        if self._ik_cache_path is not None:
+            # solutions are only valid for the robot description and joint limits they were solved with
+            arm = self.bridge_env.controller().bot.arm
+            calibration = calibration_hash(arm.robot_des.Slist, arm.robot_des.M,
+                                           arm.group_info.joint_lower_limits,
+                                           arm.group_info.joint_upper_limits)
+            self.ik_cache = IKCache(self._ik_cache_path, calibration=calibration)
+            print(f"IK cache: {len(self.ik_cache)} poses")
+
     def hard_reset(self) -> bool:
         """This conduct a hard reset the Widowxenv"""
         if self._image_size is None:
@@ -143,8 +170,17 @@ class WidowXActionServer():
             print_red("WARNING: env not initialized.")
             return {"status": WidowXStatus.NOT_INITIALIZED}
 
+        self._motion_time = None
+        self._segments = None
         status = self._action_methods[type](req_payload)
-        return {"status": status}
+        res = {"status": status}
+        if self._motion_time is not None:
+            res["motion_time"] = self._motion_time
+        if self._segments is not None:
+            res["segments"] = self._segments
+        if self.ik_cache is not None:
+            res["ik_cache"] = self.ik_cache.stats()
+        return res
 
     def __init(self, payload) -> WidowXStatus:
         do_reinit = not self._env_params == payload["env_params"]
@@ -191,12 +227,17 @@ class WidowXActionServer():
         return obs
 
     def __gripper(self, payload) -> WidowXStatus:
+        start = time.time()
         if payload["open"] > 1:  # convert to bool, for future float support
             self.bridge_env.controller().open_gripper()
         elif 0 < payload["open"]:
             self.bridge_env.controller().move_gripper(payload["open"])
         else:
             self.bridge_env.controller().close_gripper()
+        if payload.get("blocking", False):
+            # until the fingers stop, at the target or on the piece they hold
+            self.bridge_env.controller().wait_until_gripper_position_reached()
+        self._motion_time = time.time() - start
         return WidowXStatus.SUCCESS
 
     def __move(self, payload) -> WidowXStatus:
@@ -205,23 +246,157 @@ class WidowXActionServer():
             eep = pose
         else:
             eep = self.get_tf_mat(pose)
+        controller = self.bridge_env.controller()
+        # poses given as vectors are looked up in the IK cache
+        cached = self.ik_cache is not None and pose.shape != (4, 4)
+        joints = self.ik_cache.get(pose) if cached else None
         try:
-            self.bridge_env.controller().move_to_eep(
-                eep,
-                duration=payload["duration"],
-                blocking=payload["blocking"],
-                step=False,
-            )
-            self.bridge_env._reset_previous_qpos()
+            # a blocking move returns once the joint states have converged on the
+            # IK solution instead of after the whole trajectory time
+            if joints is not None:
+                controller.move_to_joint_angles(joints, duration=payload["duration"], blocking=False)
+            else:
+                solve_start = time.time()
+                # the effort check is done once the arm got there, right after sending it means nothing
+                controller.move_to_eep(
+                    eep,
+                    duration=payload["duration"],
+                    blocking=False,
+                    step=False,
+                    check_effort=False,
+                )
+                if cached:
+                    # a non-blocking move_to_eep returns right after solving and sending the command
+                    self.ik_cache.put(pose, controller.des_joint_angles, time.time() - solve_start)
+            # the motion time starts once the command is out, IK solving is not motion
+            start = time.time()
         except Environment_Exception as e:
             print_red("Move execution error: {}".format(e))
             return WidowXStatus.EXECUTION_FAILURE
+        try:
+            if payload["blocking"]:
+                return self.__settle(controller, controller.des_joint_angles, 2 * payload["duration"] + 2.0)
+            return WidowXStatus.SUCCESS
+        finally:
+            self.bridge_env._reset_previous_qpos()
+            self._motion_time = time.time() - start
+
+    def __settle(self, controller, target, timeout) -> WidowXStatus:
+        """
+        Wait for the joints to settle at target, then check the joint efforts.
+        NOT_SETTLED if they didn't in time (e.g. the droop at full reach),
+        EFFORT_EXCEEDED if the effort check sent the arm to neutral.
+        """
+        kwargs = {}
+        if self._settle_tolerance is not None:
+            kwargs["position_tolerance"] = self._settle_tolerance
+        timeout = self._settle_timeout if self._settle_timeout is not None else timeout
+        settled = controller.wait_until_joint_positions_reached(target, timeout=timeout, **kwargs)
+        try:
+            # also when not settled, the arm may be stuck pressing on something
+            controller.check_joint_effort()
+        except Environment_Exception:
+            print_red("Joint effort exceeded, arm sent to neutral")
+            return WidowXStatus.EFFORT_EXCEEDED
+        if not settled:
+            print_red("Move did not settle at its target")
+            return WidowXStatus.NOT_SETTLED
         return WidowXStatus.SUCCESS
 
+    def __move_through(self, payload) -> WidowXStatus:
+        """
+        Move through every pose in payload["poses"] along one planned
+        joint-space trajectory, blending past the intermediate poses
+        instead of stopping at them. EXECUTION_FAILURE if there is no
+        trajectory to plan, before the arm moves; once it has moved, the
+        statuses of __settle.
+        """
+        # imported here as the clients don't need the controller package
+        from widowx_controller.trajectory import plan_trajectory
+
+        poses = payload["poses"]
+        controller = self.bridge_env.controller()
+        solve_start = time.time()
+        joints = [None if self.ik_cache is None else self.ik_cache.get(pose) for pose in poses]
+        missing = [i for i, pose_joints in enumerate(joints) if pose_joints is None]
+        if missing:
+            solutions, success = controller.solve_ik_batch(
+                np.array([self.get_tf_mat(poses[i]) for i in missing]))
+            if not np.all(success):
+                print_red("No IK solution for {} poses of the trajectory".format(
+                    len(success) - np.count_nonzero(success)))
+                return WidowXStatus.EXECUTION_FAILURE
+            seconds = (time.time() - solve_start) / len(missing)
+            for i, solution in zip(missing, solutions):
+                joints[i] = solution
+                if self.ik_cache is not None:
+                    self.ik_cache.put(poses[i], solution, seconds)
+
+        current = controller.get_joint_angles()
+        if current is None:
+            print_red("No joint states to start the trajectory from")
+            return WidowXStatus.EXECUTION_FAILURE
+        waypoints = np.vstack([current, joints])
+        if np.max(np.abs(np.diff(waypoints, axis=0))) > np.pi:
+            # solutions on different IK branches, interpolating between them would swing the arm around
+            print_red("Trajectory waypoints are on different IK branches")
+            return WidowXStatus.EXECUTION_FAILURE
+
+        trajectory = plan_trajectory(waypoints)
+        # the motion time starts with the stream, IK solving and planning are not motion
+        start = time.time()
+        controller.follow_joint_trajectory(trajectory)
+        try:
+            if payload["blocking"]:
+                return self.__settle(controller, waypoints[-1], 2.0)
+            return WidowXStatus.SUCCESS
+        finally:
+            self.bridge_env._reset_previous_qpos()
+            self._motion_time = time.time() - start
+
     def __step_action(self, payload) -> WidowXStatus:
+        start = time.time()
         self.bridge_env.step(payload["action"], blocking=payload["blocking"])
+        self._motion_time = time.time() - start
         return WidowXStatus.SUCCESS
 
+    def __pick_place(self, payload) -> WidowXStatus:
+        # imported here as pick_and_place imports this module
+        from widowx_envs.pick_and_place import pick_and_place
+
+        # the same sequence the client runs, with every step a local call
+        timer = pick_and_place(payload["xy_initial"], payload["xy_final"], payload["height"],
+                               payload["clearance_height"], LocalClient(self.__action),
+                               gripper_width=payload["gripper_width"], blocking=payload["blocking"],
+                               blend=payload.get("blend", False), verbose=False)
+        self._segments = timer.segments
+        self._motion_time = sum(motion for _, _, motion in timer.segments if motion is not None)
+        if self.ik_cache is not None and self.ik_cache.dirty:
+            self.ik_cache.save()
+        return timer.status
+
+    def __ik_calibrate(self, payload) -> WidowXStatus:
+        """Solve and store IK for every pose in payload["poses"] not cached yet."""
+        if self.ik_cache is None:
+            print_red("No IK cache, start the server with --ik-cache")
+            return WidowXStatus.EXECUTION_FAILURE
+        poses = [pose for pose in payload["poses"] if pose not in self.ik_cache]
+        solved, failed = 0, 0
+        if poses:
+            start = time.time()
+            joints, success = self.bridge_env.controller().solve_ik_batch(
+                np.array([self.get_tf_mat(pose) for pose in poses]))
+            seconds = (time.time() - start) / len(poses)
+            for pose, pose_joints, ok in zip(poses, joints, success):
+                if ok:
+                    self.ik_cache.put(pose, pose_joints, seconds)
+            solved = int(np.count_nonzero(success))
+            failed = len(poses) - solved
+        self.ik_cache.save()
+        print(f"IK calibration: {solved} poses solved, {failed} without a solution, "
+              f"{len(self.ik_cache)} cached")
+        return WidowXStatus.SUCCESS if failed == 0 else WidowXStatus.EXECUTION_FAILURE
+
     def __reset(self, payload) -> WidowXStatus:
         # NOTE(YL): in bridge env, the entire process is very stateful,
         #           even reset might not be enough to reset the state
@@ -235,6 +410,37 @@ class WidowXActionServer():
 ##############################################################################
 
 
+class LocalClient():
+    """
+    The motion methods of WidowXClient, calling a server's action handler
+    directly. Lets sequences written against the client run on the server
+    without a network round trip per step.
+    """
+
+    def __init__(self, act):
+        self.__act_callback = act
+        self.last_motion_time = None
+
+    def __act(self, type: str, payload: dict) -> WidowXStatus:
+        res = self.__act_callback(type, payload)
+        self.last_motion_time = res.get("motion_time")
+        return res["status"]
+
+    def move(self, pose: np.ndarray, duration: float = 1.0, blocking: bool = False) -> WidowXStatus:
+        return self.__act("move", {"pose": pose, "duration": duration, "blocking": blocking})
+
+    def move_through(self, poses: np.ndarray, blocking: bool = True) -> WidowXStatus:
+        return self.__act("move_through", {"poses": poses, "blocking": blocking})
+
+    def move_gripper(self, state: float, blocking: bool = False) -> WidowXStatus:
+        return self.__act("gripper", {"open": state, "blocking": blocking})
+
+    def step_action(self, action: np.ndarray, blocking=False) -> WidowXStatus:
+        return self.__act("step_action", {"action": action, "blocking": blocking})
+
+##############################################################################
+
+
 class WidowXClient():
     def __init__(self,
                  host: str = "localhost",
@@ -249,6 +455,13 @@ class WidowXClient():
         edgeml_config.port_number = port
         edgeml_config.broadcast_port = port + 1
         self.__client = ActionClient(host, edgeml_config)
+        # seconds the server spent executing the last move, gripper, step or
+        # pick_place action, None if it did not say
+        self.last_motion_time = None
+        # (name, wall seconds, motion seconds) of every step of the last pick_place
+        self.last_segments = None
+        # IKCache.stats() of the server after the last action, None without a cache
+        self.ik_cache_stats = None
         print("Initialized widowx client.")
 
     def init(self,
@@ -275,17 +488,31 @@ class WidowXClient():
             :param pose: dim of 6, [x, y, z, roll, pitch, yaw] or
                          a 4x4 tf matrix
             :param duration: time to move to the pose. Not implemented
-            :param blocking: whether to block the server until the move is done
+            :param blocking: whether to block the server until the joints have
+                             settled at the pose
         """
         assert len(pose) == 6 or pose.shape == (4, 4), "invalid pose shape"
         _payload = {"pose": pose, "duration": duration, "blocking": blocking}
-        res = self.__client.act("move", _payload)
-        return WidowXStatus.NO_CONNECTION if res is None else res["status"]
+        return self.__act("move", _payload)
 
-    def move_gripper(self, state: float) -> WidowXStatus:
-        """Open or close the gripper. 1.0 is open, 0.0 is closed."""
-        res = self.__client.act("gripper", {"open": state})
-        return WidowXStatus.NO_CONNECTION if res is None else res["status"]
+    def move_through(self, poses: np.ndarray, blocking: bool = True) -> WidowXStatus:
+        """
+        Move through a list of poses in one smooth joint-space trajectory,
+        only stopping at the last one.
+            :param poses: K x 6, [x, y, z, roll, pitch, yaw] per pose
+            :param blocking: whether to block the server until the joints have
+                             settled at the last pose
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        assert poses.ndim == 2 and poses.shape[1] == 6, "invalid poses shape"
+        return self.__act("move_through", {"poses": poses, "blocking": blocking})
+
+    def move_gripper(self, state: float, blocking: bool = False) -> WidowXStatus:
+        """
+        Open or close the gripper. 1.0 is open, 0.0 is closed.
+            :param blocking: whether to block until the fingers stopped moving
+        """
+        return self.__act("gripper", {"open": state, "blocking": blocking})
 
     def step_action(self, action: np.ndarray, blocking=False) -> WidowXStatus:
         """
@@ -293,8 +520,52 @@ class WidowXClient():
         Note that the action is in relative space.
         """
         assert len(action) in [5, 7], "invalid action shape"
-        res = self.__client.act("step_action", {"action": action,
-                                                "blocking": blocking})
+        return self.__act("step_action", {"action": action, "blocking": blocking})
+
+    def pick_place(self,
+                   xy_initial,
+                   xy_final,
+                   height: float,
+                   clearance_height: float,
+                   gripper_width: float = 0.8,
+                   blocking: bool = True,
+                   blend: bool = False,
+                   ) -> WidowXStatus:
+        """
+        Pick up an object and place it elsewhere in one request: the server
+        runs the whole pick_and_place.pick_and_place sequence, including its
+        recovery moves, locally.
+            :param xy_initial: xy of the object in the robot frame
+            :param xy_final: xy of the destination in the robot frame
+            :param height: height of the object
+            :param clearance_height: height to carry the object at
+            :param blend: move between the gripper actions in planned
+                          trajectories that don't stop at every waypoint
+            :return: the status of the first step that failed, SUCCESS if none did
+        """
+        payload = {"xy_initial": [float(v) for v in xy_initial],
+                   "xy_final": [float(v) for v in xy_final],
+                   "height": float(height),
+                   "clearance_height": float(clearance_height),
+                   "gripper_width": float(gripper_width),
+                   "blocking": blocking,
+                   "blend": blend}
+        return self.__act("pick_place", payload)
+
+    def calibrate_ik(self, poses: np.ndarray) -> WidowXStatus:
+        """
+        Have the server solve IK for every pose (N x 6 [x, y, z, roll,
+        pitch, yaw]) and keep the solutions in its IK cache, so that later
+        moves to them are joint-space commands.
+        """
+        return self.__act("ik_calibrate", {"poses": np.asarray(poses, dtype=np.float64)})
+
+    def __act(self, type: str, payload: dict) -> WidowXStatus:
+        res = self.__client.act(type, payload)
+        self.last_motion_time = None if res is None else res.get("motion_time")
+        self.last_segments = None if res is None else res.get("segments")
+        if res is not None and "ik_cache" in res:
+            self.ik_cache_stats = res["ik_cache"]
         return WidowXStatus.NO_CONNECTION if res is None else res["status"]
 
     def reset(self) -> WidowXStatus:
@@ -355,10 +626,18 @@ def main():
     parser.add_argument('--ip', type=str, default='localhost')
     parser.add_argument('--port', type=int, default=5556)
     parser.add_argument('--test', action='store_true', help='run in test mode')
+    parser.add_argument('--ik-cache', type=str, default=None,
+                        help='file to keep the IK solutions of visited poses in (server)')
+    parser.add_argument('--settle-tolerance', type=float, default=None,
+                        help='rad every joint has to be within for a blocking move to be done (server)')
+    parser.add_argument('--settle-timeout', type=float, default=None,
+                        help='seconds to wait for a blocking move to settle, 2 * duration + 2 by default (server)')
     args = parser.parse_args()
 
     if args.server:
-        widowx_server = WidowXActionServer(port=args.port, testing=args.test)
+        widowx_server = WidowXActionServer(port=args.port, testing=args.test, ik_cache_path=args.ik_cache,
+                                           settle_tolerance=args.settle_tolerance,
+                                           settle_timeout=args.settle_timeout)
 
         # try capture errors and hard restart the server
         while True:
@@ -107,22 +107,19 @@ while running:
         cell_diffs = {}
 
         if grid:
-            # sum the difference in each cell
-            for cell in grid:
+            # label each pixel with its cell, then sum the difference in every cell at once
+            labels = np.full(diff.shape, len(grid), dtype=np.int32)
+            for i, cell in enumerate(grid):
+                min_x, min_y, max_x, max_y = (max(int(v), 0) for v in cell.bounds)
+                labels[min_y:max_y, min_x:max_x] = i
+            sums = np.bincount(labels.ravel(), weights=diff.ravel(), minlength=len(grid) + 1)
+
+            for i, cell in enumerate(grid):
                 ext_pts = cell.exterior.coords
                 pts = np.array(ext_pts, np.int32)
                 pts = pts.reshape((-1, 1, 2))
                 cv2.polylines(diff, [pts], True, (0, 0, 255), 1)
-                
-                min_x, min_y, max_x, max_y = cell.bounds
-                cell_diff = 0
-
-                for x in range(int(min_x), int(max_x)):
-                    for y in range(int(min_y), int(max_y)):
-                        cell_diff += diff[y][x]
-                        
-                
-                cell_diffs[cell] = cell_diff
+                cell_diffs[cell] = sums[i]
                 
 
         